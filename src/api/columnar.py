@@ -0,0 +1,132 @@
+import io
+from collections.abc import AsyncIterator, Sequence
+from decimal import Decimal
+from typing import Any, Literal
+
+import asyncpg
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BATCH_ROWS = 65_536
+
+# UUID — словарные строки (в pandas — category), numeric — float64:
+# колонки читаются в DataFrame без разбора текста и почти без копирования
+SCHEMA = pa.schema(
+	[
+		("date", pa.date32()),
+		("branch_id", pa.dictionary(pa.int32(), pa.string())),
+		("product_id", pa.dictionary(pa.int32(), pa.string())),
+		("demand", pa.float64()),
+		("min_qty", pa.float64()),
+		("available", pa.float64()),
+		("qty", pa.float64()),
+		("logdays", pa.int32()),
+	]
+)
+
+Encoding = Literal["zstd", "gzip"]
+# порядок — предпочтение сервера при равных q
+ENCODINGS: tuple[Encoding, ...] = ("zstd", "gzip")
+
+
+def negotiate_encoding(accept_encoding: str | None) -> Encoding | None:
+	"""Выбор Content-Encoding по Accept-Encoding: zstd, затем gzip"""
+	offered: dict[str, float] = {}
+	for part in (accept_encoding or "").split(","):
+		name, _, params = part.strip().partition(";")
+		quality = 1.0
+		if params.strip().startswith("q="):
+			try:
+				quality = float(params.strip()[2:])
+			except ValueError:
+				continue
+		offered[name.strip().lower()] = quality
+
+	# аннотация сохраняет Literal: иначе кортеж выводится как (float, int, str)
+	candidates: list[tuple[float, int, Encoding]] = [
+		(offered.get(name, offered.get("*", 0.0)), -index, name)
+		for index, name in enumerate(ENCODINGS)
+	]
+	quality, _, name = max(candidates)
+	return name if quality > 0 else None
+
+
+def _column(values: Sequence[Any], field: pa.Field) -> pa.Array:
+	if pa.types.is_dictionary(field.type):
+		return pa.array([str(value) for value in values]).dictionary_encode()
+	if pa.types.is_floating(field.type):
+		# Decimal или str (PG_TEXT_CODECS)
+		values = [float(v) if isinstance(v, Decimal | str) else v for v in values]
+	return pa.array(values, type=field.type)
+
+
+def to_record_batch(records: Sequence[asyncpg.Record]) -> pa.RecordBatch:
+	"""Колонки собираются по одной из транспонированного результата"""
+	columns = list(zip(*records, strict=True)) if records else [()] * len(SCHEMA)
+	return pa.RecordBatch.from_arrays(
+		[_column(values, field) for values, field in zip(columns, SCHEMA, strict=True)],
+		schema=SCHEMA,
+	)
+
+
+async def _batches(
+	records: AsyncIterator[asyncpg.Record], batch_rows: int
+) -> AsyncIterator[pa.RecordBatch]:
+	chunk: list[asyncpg.Record] = []
+	async for record in records:
+		chunk.append(record)
+		if len(chunk) >= batch_rows:
+			yield to_record_batch(chunk)
+			chunk.clear()
+	if chunk:
+		yield to_record_batch(chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+	"""Накапливает записанные байты до drain(); переживает close() —
+	CompressedOutputStream закрывает поток под собой"""
+
+	def __init__(self) -> None:
+		self._parts: list[bytes] = []
+
+	def writable(self) -> bool:
+		return True
+
+	def write(self, data: bytes) -> int:  # type: ignore[override]
+		self._parts.append(bytes(data))
+		return len(data)
+
+	def drain(self) -> bytes:
+		data = b"".join(self._parts)
+		self._parts.clear()
+		return data
+
+
+async def arrow_chunks(
+	records: AsyncIterator[asyncpg.Record],
+	encoding: Encoding | None = None,
+	batch_rows: int = BATCH_ROWS,
+) -> AsyncIterator[bytes]:
+	"""Arrow IPC stream по батчам; encoding сжимает поток целиком
+	кодеком pyarrow (для Content-Encoding)"""
+	chunks = _ChunkSink()
+	sink = pa.CompressedOutputStream(chunks, encoding) if encoding else chunks
+	with pa.ipc.new_stream(sink, SCHEMA) as writer:
+		async for batch in _batches(records, batch_rows):
+			writer.write_batch(batch)
+			sink.flush()
+			yield chunks.drain()
+	sink.close()
+	yield chunks.drain()
+
+
+async def parquet_bytes(
+	records: AsyncIterator[asyncpg.Record], batch_rows: int = BATCH_ROWS
+) -> bytes:
+	"""Parquet собирается целиком (footer пишется в конце), сжатие — zstd
+	по колонкам внутри файла, поэтому Content-Encoding ему не нужен"""
+	buffer = io.BytesIO()
+	with pq.ParquetWriter(buffer, SCHEMA, compression="zstd") as writer:
+		async for batch in _batches(records, batch_rows):
+			writer.write_batch(batch)
+	return buffer.getvalue()
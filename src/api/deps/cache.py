@@ -0,0 +1,19 @@
+from typing import Annotated
+
+from fastapi import Depends, Request
+
+from core.workflow.cache import DistributionCache, MetadataCache
+
+
+async def get_distribution_cache(request: Request) -> DistributionCache:
+	cache: DistributionCache = request.app.state.distribution_cache
+	return cache
+
+
+async def get_metadata_cache(request: Request) -> MetadataCache:
+	cache: MetadataCache = request.app.state.metadata_cache
+	return cache
+
+
+DistributionCacheDep = Annotated[DistributionCache, Depends(get_distribution_cache)]
+MetadataCacheDep = Annotated[MetadataCache, Depends(get_metadata_cache)]
@@ -0,0 +1,94 @@
+from datetime import date
+from typing import Annotated
+from uuid import UUID
+
+from fastapi import Depends, HTTPException, Query, status
+
+from config import cfg
+from core.workflow.dataclasses import (
+	Allocation,
+	DistributionParams,
+	PackingOrder,
+	check_date_range,
+)
+from core.workflow.profiles import get_profile
+
+
+async def get_distribution_params(
+	run_date: date | None = Query(
+		default=None, description="Дата расчета (по умолчанию — сегодня)"
+	),
+	date_from: date | None = Query(
+		default=None, description="Начало диапазона дат (вместе с date_to)"
+	),
+	date_to: date | None = Query(
+		default=None, description="Конец диапазона дат включительно"
+	),
+	branch_id: UUID | None = Query(default=None, description="Фильтр по филиалу"),
+	product_id: UUID | None = Query(default=None, description="Фильтр по товару"),
+	category_id: UUID | None = Query(default=None, description="Фильтр по категории"),
+	min_demand: float | None = Query(default=None, description="Минимальный спрос"),
+	limit: int | None = Query(default=None, description="Лимит записей"),
+	respect_volume: bool = Query(default=False, description="Учет объема"),
+	allocation: Allocation = Query(
+		default="independent",
+		description=(
+			"Распределение остатка РЦ: independent — без учета других филиалов, "
+			"proportional — пропорционально спросу, greedy — по убыванию спроса, "
+			"priority — сначала min_qty, остаток по убыванию спроса"
+		),
+	),
+	pack_by: PackingOrder = Query(
+		default="demand",
+		description=(
+			"Порядок укладки в свободный объем филиала при respect_volume: "
+			"demand — по убыванию спроса, density — по спросу на м³ единицы товара"
+		),
+	),
+	profile: str = Query(
+		default="default",
+		description="Профиль источников данных (см. /manage/profiles)",
+	),
+) -> DistributionParams:
+	try:
+		source = get_profile(profile)
+	except KeyError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_404_NOT_FOUND,
+			detail=f"Unknown data source profile: '{profile}'",
+		) from exc
+
+	if (date_from is None) != (date_to is None):
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="date_from and date_to must be given together",
+		)
+	if date_from and date_to:
+		if run_date:
+			raise HTTPException(
+				status_code=status.HTTP_400_BAD_REQUEST,
+				detail="run_date cannot be combined with date_from/date_to",
+			)
+		try:
+			check_date_range(date_from, date_to, cfg.distribution_max_days)
+		except ValueError as exc:
+			raise HTTPException(
+				status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+			) from exc
+
+	return DistributionParams(
+		date=date_from or run_date or date.today(),
+		date_to=date_to,
+		branch_id=branch_id,
+		product_id=product_id,
+		category_id=category_id,
+		min_demand=min_demand,
+		limit=limit,
+		respect_volume=respect_volume,
+		allocation=allocation,
+		pack_by=pack_by,
+		source=source,
+	)
+
+
+DistributionParamsDep = Annotated[DistributionParams, Depends(get_distribution_params)]
@@ -0,0 +1,13 @@
+from typing import Annotated
+
+from fastapi import Depends, Request
+
+from core.workflow.plan import SlowQueryLog
+
+
+async def get_slow_query_log(request: Request) -> SlowQueryLog:
+	slow_log: SlowQueryLog = request.app.state.slow_query_log
+	return slow_log
+
+
+SlowQueryLogDep = Annotated[SlowQueryLog, Depends(get_slow_query_log)]
@@ -1,10 +1,13 @@
+from datetime import date as Date
 from decimal import Decimal
+from typing import Any
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class DistributionRow(BaseModel):
+	date: Date
 	branch_id: UUID
 	product_id: UUID
 	demand: Decimal
@@ -12,3 +15,40 @@ class DistributionRow(BaseModel):
 	min_qty: Decimal
 	qty: Decimal
 	logdays: int | None
+
+
+class DistributionPage(BaseModel):
+	items: list[DistributionRow]
+	next: str | None = None
+
+
+class DistributionPlan(BaseModel):
+	# вывод EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) как есть
+	plan: list[dict[str, Any]]
+	# строк в результате и время выполнения по данным EXPLAIN ANALYZE, секунды
+	rows: int
+	seconds: float
+
+
+class DistributionFilterSet(BaseModel):
+	key: str
+	branch_id: UUID | None = None
+	product_id: UUID | None = None
+	category_id: UUID | None = None
+	min_demand: float | None = None
+	limit: int | None = Field(default=None, ge=1)
+
+
+class DistributionBatchRequest(BaseModel):
+	requests: list[DistributionFilterSet] = Field(min_length=1, max_length=500)
+
+	@model_validator(mode="after")
+	def unique_keys(self) -> "DistributionBatchRequest":
+		keys = [item.key for item in self.requests]
+		if len(keys) != len(set(keys)):
+			raise ValueError("Filter set keys must be unique")
+		return self
+
+
+class DistributionBatch(BaseModel):
+	results: dict[str, list[DistributionRow]]
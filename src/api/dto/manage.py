@@ -17,3 +17,22 @@ class Table(BaseModel):
 
 class Tables(BaseModel):
 	tables: list[Table]
+
+
+class Profile(BaseModel):
+	name: str
+	schema_name: str
+	rc_table: str
+	branch_table: str
+	needs_table: str
+	min_table: str
+	volume_table: str
+	limit_table: str
+	product_table: str
+	logdays_table: str
+	rc_available_table: str | None
+	branch_volume_table: str | None
+
+
+class Profiles(BaseModel):
+	profiles: list[Profile]
@@ -0,0 +1,40 @@
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def version_etag(version: int, *parts: object) -> str:
+	"""ETag без тела ответа: версия данных плюс все, от чего ответ зависит
+	(параметры, формат, кодирование); repr dataclass-параметров стабилен"""
+	key = repr((version, *parts)).encode()
+	return f'"{hashlib.sha256(key).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+	"""If-None-Match: список тегов через запятую или *; слабые теги (W/)
+	сравниваются по значению"""
+	if not if_none_match:
+		return False
+	tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+	return "*" in tags or etag in tags
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+	# no-cache — клиент может хранить ответ, но перепроверяет его каждым запросом
+	return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+	"""304 без тела, если у клиента актуальная версия, иначе None"""
+	if etag_matches(request.headers.get("if-none-match"), etag):
+		return Response(status_code=304, headers=etag_headers(etag))
+	return None
+
+
+def etag_response(
+	request: Request, body: bytes, etag: str, media_type: str = "application/json"
+) -> Response:
+	return not_modified(request, etag) or Response(
+		body, media_type=media_type, headers=etag_headers(etag)
+	)
@@ -3,9 +3,20 @@ from contextlib import asynccontextmanager
 
 import structlog
 from fastapi import FastAPI
+from prometheus_client import REGISTRY
 
 from config import cfg
-from core.factories.db import create_pool
+from core.factories.db import (
+	acquire_connection,
+	create_pool,
+	setup_auto_explain,
+	setup_codecs,
+	setup_text_codecs,
+)
+from core.metrics import register_pool
+from core.workflow.cache import DataVersionWatcher, DistributionCache, MetadataCache
+from core.workflow.plan import SlowQueryLog
+from core.workflow.profiles import load_profiles, validate_profiles, warm_connection
 
 logger = structlog.get_logger()
 
@@ -13,11 +24,31 @@ logger = structlog.get_logger()
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
 	logger.info("Starting app...", stage="lifespan")
-	app.state.pg_pool = await create_pool(cfg.pg_url)
+	load_profiles(cfg.data_source_profiles)
+	# кодеки только у пула API: COPY в ETL нужны бинарные кодеки numeric
+	codecs = [setup_codecs, setup_text_codecs] if cfg.pg_text_codecs else [setup_codecs]
+	hooks = [*codecs, setup_auto_explain] if cfg.slow_query_seconds else codecs
+	# прогрев после кодеков: смена кодека сбрасывает кэш statements
+	if cfg.pg_statement_cache_size:
+		hooks = [*hooks, warm_connection]
+	app.state.pg_pool = await create_pool(cfg.pg_url, init=hooks)
+	pool_collector = register_pool(app.state.pg_pool)
 	logger.info("Database pool initialized", stage="lifespan")
+	async with acquire_connection(app.state.pg_pool) as conn:
+		await validate_profiles(conn)
+
+	app.state.distribution_cache = DistributionCache(cfg.distribution_cache_rows)
+	app.state.metadata_cache = MetadataCache(cfg.manage_cache_ttl)
+	app.state.slow_query_log = SlowQueryLog(cfg.slow_query_seconds)
+	app.state.version_watcher = DataVersionWatcher(
+		cfg.pg_url, app.state.distribution_cache, app.state.metadata_cache
+	)
+	await app.state.version_watcher.start()
 
 	yield
 
 	logger.info("Shutting down app...", stage="lifespan")
+	await app.state.version_watcher.close()
+	REGISTRY.unregister(pool_collector)
 	await app.state.pg_pool.close()
 	logger.info("Database pool closed", stage="lifespan")
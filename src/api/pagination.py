@@ -0,0 +1,21 @@
+import base64
+import json
+from uuid import UUID
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(product_id: UUID, branch_id: UUID) -> str:
+	raw = json.dumps([str(product_id), str(branch_id)]).encode()
+	return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[UUID, UUID]:
+	try:
+		raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+		product_id, branch_id = json.loads(raw)
+		return UUID(product_id), UUID(branch_id)
+	except (ValueError, TypeError) as exc:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page cursor"
+		) from exc
@@ -1,54 +1,343 @@
-from datetime import date
-from uuid import UUID
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import replace
+from typing import Any, Literal
 
-from fastapi import APIRouter, Query
+import asyncpg
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
 
+from api.columnar import Encoding, arrow_chunks, negotiate_encoding, parquet_bytes
+from api.deps.cache import DistributionCacheDep
 from api.deps.db import Pool
-from api.dto.distribution import DistributionRow
+from api.deps.distribution import DistributionParamsDep
+from api.deps.plan import SlowQueryLogDep
+from api.dto.distribution import (
+	DistributionBatch,
+	DistributionBatchRequest,
+	DistributionPage,
+	DistributionPlan,
+	DistributionRow,
+)
+from api.etag import etag_headers, not_modified, version_etag
+from api.pagination import decode_cursor, encode_cursor
+from api.serialization import dumps, row_dicts, row_models
+from api.streaming import csv_chunks, ndjson_chunks
+from config import cfg
 from core.factories.db import acquire_connection
-from core.workflow.calc import calculate_distribution
+from core.metrics import (
+	MODEL_SECONDS,
+	SERIALIZE_SECONDS,
+	StreamTimer,
+	observe,
+	set_request_labels,
+)
+from core.workflow.cache import DistributionCache
+from core.workflow.calc import (
+	build_batch_query,
+	build_distribution_query,
+	group_batch,
+	stream_distribution,
+)
+from core.workflow.dataclasses import DistributionFilter, DistributionParams
+from core.workflow.plan import (
+	SlowQueryLog,
+	check_cost,
+	explain,
+	fetch_guarded,
+)
+from core.workflow.version import get_data_version
 
 router = APIRouter(tags=["distribution"])
 
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+CACHED_FORMATS = ("json", "arrow", "parquet")
 
-@router.get("/distribution", response_model=list[DistributionRow])
+
+def convert_rows(
+	rows: Sequence[asyncpg.Record],
+) -> list[dict[str, Any]] | list[DistributionRow]:
+	"""DISTRIBUTION_FAST_JSON — словари под orjson, иначе pydantic-модели"""
+	if cfg.distribution_fast_json:
+		return row_dicts(rows)
+	return row_models(rows)
+
+
+def build_rows(
+	rows: Sequence[asyncpg.Record],
+) -> list[dict[str, Any]] | list[DistributionRow]:
+	with observe(MODEL_SECONDS):
+		return convert_rows(rows)
+
+
+def json_response(content: BaseModel | dict[str, Any] | list[Any]) -> Response:
+	"""Сериализация здесь, а не в FastAPI, чтобы замерить ее отдельно"""
+	with observe(SERIALIZE_SECONDS):
+		if isinstance(content, BaseModel):
+			body = content.model_dump_json()
+		else:
+			body = dumps(content, fast=cfg.distribution_fast_json)
+	return Response(body, media_type="application/json")
+
+
+async def fetch_cached(
+	pool: asyncpg.Pool,
+	cache: DistributionCache,
+	slow_log: SlowQueryLog,
+	params: DistributionParams,
+) -> Sequence[asyncpg.Record]:
+	rows = cache.get(params)
+	if rows is None:
+		version = cache.version
+		query, args = build_distribution_query(params)
+		async with acquire_connection(pool) as conn:
+			rows = await fetch_guarded(conn, query, args, slow_log)
+		cache.put(params, rows, version)
+	return rows
+
+
+async def fetch_with_plan(
+	pool: asyncpg.Pool, params: DistributionParams
+) -> DistributionPlan:
+	"""Мимо кэша: EXPLAIN (ANALYZE, BUFFERS) выполняет запрос один раз и
+	возвращает план с фактическими временами и буферами, но не строки"""
+	query, args = build_distribution_query(params)
+	async with acquire_connection(pool) as conn:
+		await check_cost(conn, query, args, cfg.distribution_max_cost)
+		plan = await explain(conn, query, args, analyze=True)
+	return DistributionPlan(
+		plan=plan,
+		rows=plan[0]["Plan"]["Actual Rows"],
+		seconds=round(plan[0]["Execution Time"] / 1000, 4),
+	)
+
+
+async def stream_records(
+	pool: asyncpg.Pool, params: DistributionParams
+) -> AsyncIterator[asyncpg.Record]:
+	# соединение живет, пока клиент читает ответ
+	async with acquire_connection(pool) as conn:
+		async for record in stream_distribution(conn, params):
+			yield record
+
+
+async def data_version(pool: asyncpg.Pool, cache: DistributionCache) -> int:
+	"""Версия от LISTEN-наблюдателя; пока его нет — чтение одной строки"""
+	if cache.version is not None:
+		return cache.version
+	async with acquire_connection(pool) as conn:
+		return await get_data_version(conn)
+
+
+async def replay(rows: Sequence[asyncpg.Record]) -> AsyncIterator[asyncpg.Record]:
+	for row in rows:
+		yield row
+
+
+async def columnar_response(
+	rows: Sequence[asyncpg.Record], format: str, encoding: Encoding | None
+) -> Response:
+	"""Arrow/parquet из уже выбранных строк: тело собирается целиком"""
+	with observe(SERIALIZE_SECONDS):
+		if format == "parquet":
+			return Response(
+				await parquet_bytes(replay(rows)), media_type=PARQUET_MEDIA_TYPE
+			)
+		body = b"".join([chunk async for chunk in arrow_chunks(replay(rows), encoding)])
+	headers = {"Vary": "Accept-Encoding"}
+	if encoding:
+		headers["Content-Encoding"] = encoding
+	return Response(body, media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+
+async def distribution_response(
+	pool: asyncpg.Pool,
+	cache: DistributionCache,
+	slow_log: SlowQueryLog,
+	params: DistributionParams,
+	format: str,
+	encoding: Encoding | None,
+) -> Response:
+	# json, arrow и parquet — через общий кэш строк: повторный запрос UI
+	# с теми же параметрами не пересчитывает распределение
+	if format in CACHED_FORMATS:
+		rows = await fetch_cached(pool, cache, slow_log, params)
+		if format == "json":
+			return json_response(build_rows(rows))
+		return await columnar_response(rows, format, encoding)
+
+	if cfg.distribution_max_cost:
+		# до начала потока: после первого чанка ошибку уже не вернуть
+		query, args = build_distribution_query(params)
+		async with acquire_connection(pool) as conn:
+			await check_cost(conn, query, args, cfg.distribution_max_cost)
+	timer = StreamTimer()
+	records = timer.records(stream_records(pool, params))
+	chunks = ndjson_chunks if format == "ndjson" else csv_chunks
+	return StreamingResponse(
+		timer.chunks(chunks(records)),
+		media_type=STREAM_MEDIA_TYPES[format],
+	)
+
+
+@router.get("/distribution", response_model=list[DistributionRow] | DistributionPlan)
 async def get_distribution(
+	request: Request,
 	pool: Pool,
-	run_date: date | None = Query(
-		default=None, description="Дата расчета (по умолчанию — сегодня)"
+	cache: DistributionCacheDep,
+	slow_log: SlowQueryLogDep,
+	params: DistributionParamsDep,
+	format: Literal["json", "ndjson", "csv", "arrow", "parquet"] = Query(
+		default="json",
+		description=(
+			"json/arrow/parquet — через кэш результатов; ndjson/csv отдаются "
+			"потоково через серверный курсор, без кэша; arrow сжимается по "
+			"Accept-Encoding (zstd, gzip), parquet — zstd внутри"
+		),
 	),
-	branch_id: UUID | None = Query(default=None, description="Фильтр по филиалу"),
-	product_id: UUID | None = Query(default=None, description="Фильтр по товару"),
-	category_id: UUID | None = Query(default=None, description="Фильтр по категории"),
-	min_demand: float | None = Query(default=None, description="Минимальный спрос"),
-	limit: int | None = Query(default=None, description="Лимит записей"),
-	respect_volume: bool = Query(default=False, description="Учет объема"),
-	schema: str = Query(default="logistics", description="Схема в БД"),
-	rc_table: str = Query(default="rc_product_history"),
-	branch_table: str = Query(default="branch_product_history"),
-	needs_table: str = Query(default="needs"),
-	min_table: str = Query(default="min_shipment"),
-	volume_table: str = Query(default="products_vol"),
-	limit_table: str = Query(default="storage_limits"),
-	product_table: str = Query(default="products"),
-) -> list[DistributionRow]:
-	async with acquire_connection(pool) as conn:
-		rows = await calculate_distribution(
-			conn=conn,
-			date=run_date,
-			branch_id=branch_id,
-			product_id=product_id,
-			category_id=category_id,
-			min_demand=min_demand,
-			limit=limit,
-			respect_volume=respect_volume,
-			schema=schema,
-			rc_table=rc_table,
-			branch_table=branch_table,
-			needs_table=needs_table,
-			min_table=min_table,
-			volume_table=volume_table,
-			limit_table=limit_table,
-			product_table=product_table,
+	debug: Literal["plan"] | None = Query(
+		default=None,
+		description=(
+			"plan — вместо строк вернуть EXPLAIN (ANALYZE, BUFFERS): запрос "
+			"выполняется один раз, в плане фактические времена и буферы; "
+			"только для json, мимо кэша"
+		),
+	),
+	accept_encoding: str | None = Header(default=None),
+) -> Response:
+	"""ETag — версия данных и параметры: пока ETL не менял данные, повторный
+	запрос с If-None-Match получает 304 без расчета"""
+	set_request_labels("/distribution", params)
+	if debug and format != "json":
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="debug=plan is only supported for format=json",
+		)
+	if debug:
+		return json_response(await fetch_with_plan(pool, params))
+
+	encoding = negotiate_encoding(accept_encoding) if format == "arrow" else None
+	etag = version_etag(await data_version(pool, cache), params, format, encoding)
+	if cached := not_modified(request, etag):
+		return cached
+	response = await distribution_response(
+		pool, cache, slow_log, params, format, encoding
+	)
+	response.headers.update(etag_headers(etag))
+	return response
+
+
+@router.get("/distribution/page", response_model=DistributionPage)
+async def get_distribution_page(
+	request: Request,
+	pool: Pool,
+	cache: DistributionCacheDep,
+	slow_log: SlowQueryLogDep,
+	params: DistributionParamsDep,
+	page_size: int = Query(
+		default=1000, ge=1, le=50_000, description="Размер страницы"
+	),
+	cursor: str | None = Query(
+		default=None, description="Токен next из предыдущей страницы"
+	),
+) -> Response:
+	"""Keyset-пагинация: глубокие страницы стоят столько же, сколько первая"""
+	set_request_labels("/distribution/page", params)
+	if params.date_to:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Date ranges are not paginated, use /distribution?format=ndjson",
 		)
-	return [DistributionRow(**row) for row in rows]
+	if params.limit is not None:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Pages are sized by page_size, limit is not supported",
+		)
+	params = replace(
+		params,
+		limit=page_size + 1,
+		after=decode_cursor(cursor) if cursor else None,
+	)
+	etag = version_etag(await data_version(pool, cache), params)
+	if cached := not_modified(request, etag):
+		return cached
+	rows = await fetch_cached(pool, cache, slow_log, params)
+
+	next_token = None
+	if len(rows) > page_size:
+		rows = rows[:page_size]
+		next_token = encode_cursor(rows[-1]["product_id"], rows[-1]["branch_id"])
+	# поля DistributionPage без модели: строки уже в виде build_rows
+	response = json_response({"items": build_rows(rows), "next": next_token})
+	response.headers.update(etag_headers(etag))
+	return response
+
+
+@router.post("/distribution/batch", response_model=DistributionBatch)
+async def post_distribution_batch(
+	pool: Pool,
+	cache: DistributionCacheDep,
+	slow_log: SlowQueryLogDep,
+	params: DistributionParamsDep,
+	body: DistributionBatchRequest,
+) -> Response:
+	"""Много наборов фильтров за один расчет и одно соединение.
+
+	Общие параметры (дата/диапазон, профиль, режимы) — из query-строки,
+	фильтры — из тела; ответ по ключам наборов.
+	"""
+	set_request_labels("/distribution/batch", params)
+	query_filters = (
+		params.branch_id,
+		params.product_id,
+		params.category_id,
+		params.min_demand,
+		params.limit,
+	)
+	if any(value is not None for value in query_filters):
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Filters go into the request body for /distribution/batch",
+		)
+
+	# каждый набор — обычный запрос /distribution с тем же ключом кэша
+	requested = {
+		item.key: replace(
+			params,
+			branch_id=item.branch_id,
+			product_id=item.product_id,
+			category_id=item.category_id,
+			min_demand=item.min_demand,
+			limit=item.limit,
+		)
+		for item in body.requests
+	}
+	results = {key: cache.get(item) for key, item in requested.items()}
+	missing = [
+		DistributionFilter(
+			key=key,
+			branch_id=item.branch_id,
+			product_id=item.product_id,
+			category_id=item.category_id,
+			min_demand=item.min_demand,
+			limit=item.limit,
+		)
+		for key, item in requested.items()
+		if results[key] is None
+	]
+	if missing:
+		version = cache.version
+		query, args = build_batch_query(params, missing)
+		async with acquire_connection(pool) as conn:
+			computed = group_batch(
+				missing, await fetch_guarded(conn, query, args, slow_log)
+			)
+		for key, rows in computed.items():
+			cache.put(requested[key], rows, version)
+			results[key] = rows
+
+	with observe(MODEL_SECONDS):
+		batch = {key: convert_rows(rows or ()) for key, rows in results.items()}
+	return json_response({"results": batch})
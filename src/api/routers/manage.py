@@ -1,40 +1,80 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import Response
 
+from api.deps.cache import MetadataCacheDep
 from api.deps.db import Pool
-from api.dto.manage import Field, Schemas, Table, Tables
+from api.dto.manage import Field, Profile, Profiles, Schemas, Table, Tables
+from api.etag import etag_response
 from core.factories.db import acquire_connection
 from core.workflow.datasources import get_schema_structure, get_schemas
+from core.workflow.profiles import PROFILES
 
 router = APIRouter(tags=["manage"])
 
 
 @router.get("/manage/schemas", response_model=Schemas)
-async def schemas(pool: Pool) -> Schemas:
-	async with acquire_connection(pool) as conn:
-		schemas = await get_schemas(conn)
+async def schemas(request: Request, pool: Pool, cache: MetadataCacheDep) -> Response:
+	async def load() -> bytes:
+		async with acquire_connection(pool) as conn:
+			schemas = await get_schemas(conn)
+		return Schemas(schemas=schemas).model_dump_json().encode()
 
-	return Schemas(schemas=schemas)
+	cached = await cache.get(("schemas",), load)
+	return etag_response(request, cached.body, cached.etag)
 
 
 @router.get("/manage/tables", response_model=Tables)
 async def tables(
+	request: Request,
 	pool: Pool,
+	cache: MetadataCacheDep,
 	schema: str = Query(
 		default="logistics",
 		alias="schema",
 		title="Имя схемы",
 		description="Имя схемы для получения структур столов",
 	),
-) -> Tables:
-	async with acquire_connection(pool) as conn:
-		meta = await get_schema_structure(conn, schema=schema)
-
-	return Tables(
-		tables=[
-			Table(
-				name=t.name,
-				fields=[Field(name=f.name, type=f.type) for f in t.fields],
+) -> Response:
+	async def load() -> bytes:
+		async with acquire_connection(pool) as conn:
+			meta = await get_schema_structure(conn, schema=schema)
+		return (
+			Tables(
+				tables=[
+					Table(
+						name=t.name,
+						fields=[Field(name=f.name, type=f.type) for f in t.fields],
+					)
+					for t in meta.tables
+				]
 			)
-			for t in meta.tables
+			.model_dump_json()
+			.encode()
+		)
+
+	# в кэше готовое тело: модели собираются один раз на TTL
+	cached = await cache.get(("tables", schema), load)
+	return etag_response(request, cached.body, cached.etag)
+
+
+@router.get("/manage/profiles", response_model=Profiles)
+async def profiles() -> Profiles:
+	return Profiles(
+		profiles=[
+			Profile(
+				name=p.name,
+				schema_name=p.schema,
+				rc_table=p.rc_table,
+				branch_table=p.branch_table,
+				needs_table=p.needs_table,
+				min_table=p.min_table,
+				volume_table=p.volume_table,
+				limit_table=p.limit_table,
+				product_table=p.product_table,
+				logdays_table=p.logdays_table,
+				rc_available_table=p.rc_available_table,
+				branch_volume_table=p.branch_volume_table,
+			)
+			for p in PROFILES.values()
 		]
 	)
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+	"""Метрики в формате Prometheus: стадии /distribution, пул, ETL"""
+	return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
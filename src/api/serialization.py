@@ -0,0 +1,75 @@
+from collections.abc import Sequence
+from decimal import Decimal
+from operator import itemgetter
+from typing import Any
+from uuid import UUID
+
+import asyncpg
+import orjson
+import pydantic_core
+
+from api.dto.distribution import DistributionRow
+
+# порядок ключей как у модели: ответ совпадает с путем через pydantic байт в байт
+ROW_FIELDS = tuple(DistributionRow.model_fields)
+_pick = itemgetter(*ROW_FIELDS)
+
+
+def _default(value: object) -> str:
+	# UUID asyncpg — подкласс uuid.UUID, orjson его не знает; Decimal
+	# строкой, как сериализует pydantic
+	if isinstance(value, Decimal | UUID):
+		return str(value)
+	raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _float_text(value: float | None) -> str | None:
+	# pydantic отдает float в Decimal-поле как str(Decimal(repr(value))):
+	# repr совпадает с ним везде, кроме экспоненциальной записи
+	if value is None:
+		return None
+	text = repr(value)
+	return text if "e" not in text else str(Decimal(text))
+
+
+def row_dicts(records: Sequence[asyncpg.Record]) -> list[dict[str, Any]]:
+	"""Быстрый путь: словари под orjson без моделей и валидации.
+
+	Decimal-поля, посчитанные запросом во float8, отдаются строкой, как у
+	модели; тип колонки одинаков во всех строках, поэтому смотрим первую
+	"""
+	if not records:
+		return []
+	floats = _float_columns(_pick(records[0]))
+	if not floats:
+		return [dict(zip(ROW_FIELDS, _pick(record), strict=True)) for record in records]
+	return [_row_dict(_pick(record), floats) for record in records]
+
+
+def _float_columns(values: Sequence[Any]) -> list[int]:
+	return [index for index, value in enumerate(values) if isinstance(value, float)]
+
+
+def _row_dict(values: Sequence[Any], floats: Sequence[int]) -> dict[str, Any]:
+	row = list(values)
+	for index in floats:
+		row[index] = _float_text(row[index])
+	return dict(zip(ROW_FIELDS, row, strict=True))
+
+
+def row_models(records: Sequence[asyncpg.Record]) -> list[DistributionRow]:
+	return [DistributionRow(**record) for record in records]
+
+
+def dumps(content: Any, fast: bool = True) -> bytes:
+	"""orjson или pydantic; оба понимают вложенные dict/list из row_dicts
+	и row_models соответственно"""
+	if fast:
+		return orjson.dumps(content, default=_default)
+	return pydantic_core.to_json(content)
+
+
+def record_json(record: asyncpg.Record) -> bytes:
+	"""Одна запись для NDJSON — тот же объект, что элемент JSON-ответа"""
+	values = _pick(record)
+	return orjson.dumps(_row_dict(values, _float_columns(values)), default=_default)
@@ -0,0 +1,45 @@
+import csv
+import io
+from collections.abc import AsyncIterator
+
+import asyncpg
+
+from api.serialization import record_json
+
+CHUNK_ROWS = 1000
+
+
+async def ndjson_chunks(
+	records: AsyncIterator[asyncpg.Record], chunk_rows: int = CHUNK_ROWS
+) -> AsyncIterator[bytes]:
+	"""Одна JSON-строка на запись; UUID/Decimal — строками, как в JSON-ответе"""
+	lines: list[bytes] = []
+	async for record in records:
+		lines.append(record_json(record))
+		if len(lines) >= chunk_rows:
+			yield b"\n".join(lines) + b"\n"
+			lines.clear()
+	if lines:
+		yield b"\n".join(lines) + b"\n"
+
+
+async def csv_chunks(
+	records: AsyncIterator[asyncpg.Record], chunk_rows: int = CHUNK_ROWS
+) -> AsyncIterator[str]:
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+	header_written = False
+	rows = 0
+	async for record in records:
+		if not header_written:
+			writer.writerow(record.keys())
+			header_written = True
+		writer.writerow(record.values())
+		rows += 1
+		if rows >= chunk_rows:
+			yield buffer.getvalue()
+			buffer.seek(0)
+			buffer.truncate()
+			rows = 0
+	if buffer.tell():
+		yield buffer.getvalue()
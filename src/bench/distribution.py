@@ -0,0 +1,176 @@
+import itertools
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import dataclass, replace
+from datetime import date as Date
+from datetime import timedelta
+from typing import get_args
+from uuid import UUID
+
+import asyncpg
+import structlog
+
+from bench.results import BenchResult, summarize
+from core.workflow.calc import calculate_batch, calculate_distribution
+from core.workflow.dataclasses import Allocation, DistributionFilter, DistributionParams
+
+logger = structlog.get_logger()
+
+FLAGS = ("respect_volume", "category", "min_demand", "limit")
+BENCH_LIMIT = 100
+RANGE_DAYS = 7
+# наборов фильтров в пакетном расчете: по филиалу на набор
+BATCH_SETS = 20
+BATCH_ALLOCATIONS: tuple[Allocation, ...] = ("independent", "proportional")
+
+# Значения фильтров берутся из самих данных, чтобы фильтр реально отсекал строки
+BENCH_INPUTS = """
+    WITH last AS (SELECT max(date) AS date FROM logistics.branch_product_history)
+    SELECT
+        last.date,
+        (
+            SELECT category_id FROM logistics.products
+            GROUP BY category_id ORDER BY count(*) DESC LIMIT 1
+        ) AS category_id,
+        (
+            SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY needs)
+            FROM logistics.needs
+        ) AS min_demand,
+        ARRAY(
+            SELECT branch_id FROM logistics.branch_product_history
+            WHERE date = last.date
+            GROUP BY branch_id ORDER BY count(*) DESC, branch_id
+            LIMIT $1
+        ) AS branch_ids
+    FROM last
+"""
+
+Run = Callable[[asyncpg.Connection], Awaitable[int]]
+
+
+@dataclass(frozen=True, slots=True)
+class BenchInputs:
+	date: Date
+	category_id: UUID | None
+	min_demand: float | None
+	# самые крупные филиалы дня: первый — для фильтра, все — для пакета
+	branch_ids: list[UUID]
+
+
+def iter_flag_cases(inputs: BenchInputs) -> Iterator[tuple[str, DistributionParams]]:
+	"""Все комбинации флагов calculate_distribution за день"""
+	for flags in itertools.product((False, True), repeat=len(FLAGS)):
+		volume, category, demand, limit = flags
+		label = ",".join(name for name, on in zip(FLAGS, flags, strict=True) if on)
+		yield (
+			f"distribution[{label or 'base'}]",
+			DistributionParams(
+				date=inputs.date,
+				category_id=inputs.category_id if category else None,
+				min_demand=inputs.min_demand if demand else None,
+				respect_volume=volume,
+				limit=BENCH_LIMIT if limit else None,
+			),
+		)
+
+
+def iter_mode_cases(inputs: BenchInputs) -> Iterator[tuple[str, DistributionParams]]:
+	"""Режимы распределения, фильтр филиала и диапазон дат — без учета
+	объема и с ним; порядок укладки density — только с учетом объема"""
+	day = DistributionParams(date=inputs.date)
+	variants = {
+		**{
+			f"allocation={allocation}": replace(day, allocation=allocation)
+			for allocation in get_args(Allocation)
+			if allocation != day.allocation
+		},
+		"branch": replace(day, branch_id=inputs.branch_ids[0]),
+		"range": replace(
+			day, date=inputs.date - timedelta(days=RANGE_DAYS - 1), date_to=inputs.date
+		),
+	}
+	for label, params in variants.items():
+		yield f"distribution[{label}]", params
+		yield (
+			f"distribution[{label},respect_volume]",
+			replace(params, respect_volume=True),
+		)
+	yield (
+		"distribution[respect_volume,pack_by=density]",
+		replace(day, respect_volume=True, pack_by="density"),
+	)
+
+
+def batch_filters(inputs: BenchInputs) -> list[DistributionFilter]:
+	return [
+		*(
+			DistributionFilter(key=str(branch), branch_id=branch)
+			for branch in inputs.branch_ids
+		),
+		DistributionFilter(key="category", category_id=inputs.category_id),
+		DistributionFilter(key="min_demand", min_demand=inputs.min_demand),
+	]
+
+
+def iter_cases(inputs: BenchInputs) -> Iterator[tuple[str, Run]]:
+	for name, params in itertools.chain(
+		iter_flag_cases(inputs), iter_mode_cases(inputs)
+	):
+		yield name, lambda conn, p=params: _count(calculate_distribution(conn, p))
+
+	filters = batch_filters(inputs)
+	for allocation, volume in itertools.product(BATCH_ALLOCATIONS, (False, True)):
+		params = DistributionParams(
+			date=inputs.date, allocation=allocation, respect_volume=volume
+		)
+		label = f"allocation={allocation}" + (",respect_volume" if volume else "")
+		yield (
+			f"batch[{label},sets={len(filters)}]",
+			lambda conn, p=params: _count_batch(calculate_batch(conn, p, filters)),
+		)
+
+
+async def _count(rows: Awaitable[list[asyncpg.Record]]) -> int:
+	return len(await rows)
+
+
+async def _count_batch(results: Awaitable[dict[str, list[asyncpg.Record]]]) -> int:
+	return sum(len(rows) for rows in (await results).values())
+
+
+async def load_inputs(conn: asyncpg.Connection) -> BenchInputs:
+	row = await conn.fetchrow(BENCH_INPUTS, BATCH_SETS)
+	if row is None or row["date"] is None or not row["branch_ids"]:
+		raise RuntimeError("No history to benchmark: run ETL or pass --etl-days")
+	return BenchInputs(
+		date=row["date"],
+		category_id=row["category_id"],
+		min_demand=row["min_demand"],
+		branch_ids=row["branch_ids"],
+	)
+
+
+async def bench_distribution(
+	conn: asyncpg.Connection, repeat: int, scale: str
+) -> list[BenchResult]:
+	"""Первый прогон каждой формы не засчитывается: prepare и холодный кэш"""
+	inputs = await load_inputs(conn)
+
+	results = []
+	for name, run in iter_cases(inputs):
+		rows = await run(conn)
+		timings = []
+		for _ in range(repeat):
+			started = time.perf_counter()
+			await run(conn)
+			timings.append(time.perf_counter() - started)
+		result = summarize(f"{name}@{scale}", "distribution", timings, rows)
+		logger.info(
+			"Benchmark case done",
+			name=result.name,
+			seconds=round(result.seconds, 4),
+			rows=rows,
+			stage="bench",
+		)
+		results.append(result)
+	return results
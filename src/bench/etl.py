@@ -0,0 +1,68 @@
+import functools
+import time
+
+import asyncpg
+import structlog
+
+from bench.results import BenchResult, summarize
+from etl.pipeline import ETL_STEPS, Step, topological_order
+from etl.populate_history import populate_history
+from etl.watermark import reset_watermarks
+
+logger = structlog.get_logger()
+
+# Таблицы, которые пишет шаг: по ним считается throughput в строках
+STEP_TABLES: dict[str, tuple[str, ...]] = {
+	"partitions": (),
+	"history": ("branch_product_history", "rc_product_history"),
+	"products": ("products",),
+	"products_vol": ("products_vol",),
+	"needs": ("needs",),
+	"logdays": ("logdays",),
+	"min_shipment": ("min_shipment",),
+	"storage_limits": ("storage_limits",),
+	"aggregates": ("rc_available_daily", "branch_volume_daily"),
+}
+
+
+def scaled_steps(days: int) -> list[Step]:
+	"""Шаги ETL в порядке зависимостей; масштаб — дни истории"""
+	history = functools.partial(populate_history, days=days)
+	return [
+		Step(step.name, history, step.depends_on) if step.name == "history" else step
+		for step in topological_order(ETL_STEPS)
+	]
+
+
+async def count_rows(pool: asyncpg.Pool, tables: tuple[str, ...]) -> int:
+	async with pool.acquire() as conn:
+		return sum(
+			[
+				await conn.fetchval(f"SELECT count(*) FROM logistics.{table}")  # noqa: S608
+				for table in tables
+			]
+		)
+
+
+async def bench_etl(pool: asyncpg.Pool, days: int) -> list[BenchResult]:
+	"""Шаги идут последовательно, а не DAG-ом, чтобы время шага не зависело
+	от соседей по пулу. Перезаписывает данные базы"""
+	# замеряется полная загрузка, а не пропуск по водяным знакам
+	async with pool.acquire() as conn:
+		await reset_watermarks(conn)
+	results = []
+	for step in scaled_steps(days):
+		started = time.perf_counter()
+		await step.run(pool)
+		elapsed = time.perf_counter() - started
+		rows = await count_rows(pool, STEP_TABLES.get(step.name, ()))
+		result = summarize(f"etl.{step.name}@days={days}", "etl", [elapsed], rows)
+		logger.info(
+			"Benchmark case done",
+			name=result.name,
+			seconds=round(elapsed, 3),
+			rows_per_sec=round(result.rows_per_sec),
+			stage="bench",
+		)
+		results.append(result)
+	return results
@@ -0,0 +1,99 @@
+import json
+import statistics
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Any, Literal
+
+BenchKind = Literal["distribution", "etl", "serialization"]
+
+
+@dataclass(frozen=True, slots=True)
+class BenchResult:
+	"""Один замер; seconds — медиана по прогонам"""
+
+	name: str
+	kind: BenchKind
+	seconds: float
+	min_seconds: float
+	max_seconds: float
+	runs: int
+	rows: int
+
+	@property
+	def rows_per_sec(self) -> float:
+		return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass(frozen=True, slots=True)
+class Comparison:
+	name: str
+	baseline: float | None
+	current: float | None
+	regressed: bool
+
+	@property
+	def change(self) -> float | None:
+		if not self.baseline or self.current is None:
+			return None
+		return self.current / self.baseline - 1
+
+
+def summarize(
+	name: str, kind: BenchKind, timings: list[float], rows: int
+) -> BenchResult:
+	return BenchResult(
+		name=name,
+		kind=kind,
+		seconds=statistics.median(timings),
+		min_seconds=min(timings),
+		max_seconds=max(timings),
+		runs=len(timings),
+		rows=rows,
+	)
+
+
+def save_results(path: Path, results: list[BenchResult], meta: dict[str, Any]) -> None:
+	payload = {
+		**meta,
+		"results": [
+			{**asdict(r), "rows_per_sec": round(r.rows_per_sec, 1)} for r in results
+		],
+	}
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n")
+
+
+def load_results(path: Path) -> dict[str, BenchResult]:
+	names = {f.name for f in fields(BenchResult)}
+	return {
+		item["name"]: BenchResult(**{k: v for k, v in item.items() if k in names})
+		for item in json.loads(path.read_text())["results"]
+	}
+
+
+def compare_results(
+	baseline: dict[str, BenchResult],
+	current: dict[str, BenchResult],
+	threshold: float,
+	min_delta: float,
+) -> list[Comparison]:
+	"""Регрессия — медиана выросла больше чем на threshold и больше чем на
+	min_delta секунд: второе отсекает шум на миллисекундных запросах"""
+	comparisons = []
+	for name in sorted(baseline.keys() | current.keys()):
+		before, after = baseline.get(name), current.get(name)
+		regressed = bool(
+			before
+			and after
+			and after.seconds > before.seconds * (1 + threshold)
+			and after.seconds - before.seconds > min_delta
+		)
+		comparisons.append(
+			Comparison(
+				name=name,
+				baseline=before.seconds if before else None,
+				current=after.seconds if after else None,
+				regressed=regressed,
+			)
+		)
+	return comparisons
@@ -0,0 +1,99 @@
+import time
+from collections.abc import Callable, Sequence
+
+import asyncpg
+import structlog
+
+from api.serialization import dumps, row_dicts, row_models
+from bench.results import BenchResult, summarize
+from config import cfg
+from core.factories.db import setup_codecs, setup_text_codecs
+from core.workflow.calc import calculate_distribution
+from core.workflow.dataclasses import DistributionParams
+
+logger = structlog.get_logger()
+
+Serializer = Callable[[Sequence[asyncpg.Record]], bytes]
+
+SERIALIZERS: dict[str, Serializer] = {
+	"pydantic": lambda rows: dumps(row_models(rows), fast=False),
+	"orjson": lambda rows: dumps(row_dicts(rows)),
+}
+
+
+def _timings(repeat: int, run: Callable[[], object]) -> list[float]:
+	timings = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		run()
+		timings.append(time.perf_counter() - started)
+	return timings
+
+
+async def _fetch_timings(
+	conn: asyncpg.Connection, params: DistributionParams, repeat: int
+) -> tuple[list[asyncpg.Record], list[float]]:
+	# первый прогон не засчитывается: prepare и холодный кэш
+	rows = await calculate_distribution(conn, params)
+	timings = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		await calculate_distribution(conn, params)
+		timings.append(time.perf_counter() - started)
+	return rows, timings
+
+
+async def bench_serialization(
+	conn: asyncpg.Connection, repeat: int, scale: str
+) -> list[BenchResult]:
+	"""Полный ответ /distribution за последний день: сборка JSON через модели
+	против orjson, отдельно — выборка с бинарными и текстовыми кодеками.
+
+	Текстовые кодеки ставятся на отдельное соединение, чтобы не менять
+	соединения пула
+	"""
+	date = await conn.fetchval("SELECT max(date) FROM logistics.branch_product_history")
+	if date is None:
+		raise RuntimeError("No history to benchmark: run ETL or pass --etl-days")
+	params = DistributionParams(date=date)
+
+	text_conn = await asyncpg.connect(
+		cfg.pg_url, server_settings=cfg.pg_server_settings
+	)
+	try:
+		await setup_codecs(text_conn)
+		await setup_text_codecs(text_conn)
+		fetched = {
+			"binary": await _fetch_timings(conn, params, repeat),
+			"text_codecs": await _fetch_timings(text_conn, params, repeat),
+		}
+	finally:
+		await text_conn.close()
+
+	binary_rows, text_rows = fetched["binary"][0], fetched["text_codecs"][0]
+	cases = {
+		f"fetch[{codecs}]": (rows, timings)
+		for codecs, (rows, timings) in fetched.items()
+	}
+	for name, serialize in SERIALIZERS.items():
+		cases[f"serialize[{name}]"] = (
+			binary_rows,
+			_timings(repeat, lambda s=serialize: s(binary_rows)),
+		)
+	cases["serialize[orjson,text_codecs]"] = (
+		text_rows,
+		_timings(repeat, lambda: SERIALIZERS["orjson"](text_rows)),
+	)
+
+	results = []
+	for name, (rows, timings) in cases.items():
+		result = summarize(f"{name}@{scale}", "serialization", timings, len(rows))
+		logger.info(
+			"Benchmark case done",
+			name=result.name,
+			seconds=round(result.seconds, 4),
+			rows_per_sec=round(result.rows_per_sec),
+			stage="bench",
+		)
+		results.append(result)
+	return results
@@ -0,0 +1,46 @@
+import datetime
+from pathlib import Path
+
+import structlog
+
+from bench.distribution import bench_distribution
+from bench.etl import bench_etl
+from bench.results import BenchResult, save_results
+from bench.serialization import bench_serialization
+from config import cfg
+from core.factories.db import acquire_connection, create_pool
+
+logger = structlog.get_logger()
+
+
+async def run_suite(output: Path, repeat: int, etl_days: list[int]) -> None:
+	"""Без etl_days расчет замеряется на текущих данных; с ними на каждом
+	масштабе сначала ETL (перезаписывает базу), затем расчет на его данных"""
+	pool = await create_pool(cfg.pg_url)
+	results: list[BenchResult] = []
+	try:
+		async with acquire_connection(pool) as conn:
+			server_version = await conn.fetchval("SHOW server_version")
+		for days in etl_days:
+			results += await bench_etl(pool, days)
+			async with acquire_connection(pool) as conn:
+				results += await bench_distribution(conn, repeat, f"days={days}")
+				results += await bench_serialization(conn, repeat, f"days={days}")
+		if not etl_days:
+			async with acquire_connection(pool) as conn:
+				results += await bench_distribution(conn, repeat, "current")
+				results += await bench_serialization(conn, repeat, "current")
+	finally:
+		await pool.close()
+
+	save_results(
+		output,
+		results,
+		{
+			"created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+			"server_version": server_version,
+			"repeat": repeat,
+			"etl_days": etl_days,
+		},
+	)
+	logger.info("Benchmark saved", path=str(output), cases=len(results))
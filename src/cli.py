@@ -1,21 +1,43 @@
 import asyncio
+import datetime
 import subprocess
 from pathlib import Path
 
 import structlog
 import typer
 import uvicorn
-
-from config import AppCfg
+from prometheus_client import start_http_server
+
+from bench.results import compare_results, load_results
+from bench.suite import run_suite
+from config import AppCfg, cfg
+from core.factories.db import acquire_connection, create_pool
+from core.workflow.dataclasses import Allocation, DistributionParams, check_date_range
+from core.workflow.export import ExportFormat, export_distribution
+from core.workflow.profiles import get_profile, load_profiles
 from etl.migrate import migrate
+from etl.partitions import main as maintain_partitions
+from etl.pipeline import main as run_etl_pipeline
+from etl.synth import SynthSpec, generate_synth
 from logger import setup_logger
 
 setup_logger()
 
 app = typer.Typer()
+etl_app = typer.Typer(help="ETL-загрузки")
+app.add_typer(etl_app, name="etl")
+bench_app = typer.Typer(help="Бенчмарки расчета и ETL на локальном PostgreSQL")
+app.add_typer(bench_app, name="bench")
 logger = structlog.get_logger()
 
 
+def serve_etl_metrics() -> None:
+	"""ETL идет отдельным процессом: счетчики COPY отдаются своим HTTP-сервером"""
+	if cfg.etl_metrics_port:
+		start_http_server(cfg.etl_metrics_port)
+		logger.info("ETL metrics served", port=cfg.etl_metrics_port, stage="etl")
+
+
 @app.command("migrate")
 def run_migrations() -> None:
 	"""Запуск миграций вручную через CLI"""
@@ -24,6 +46,139 @@ def run_migrations() -> None:
 	logger.info("Migrations complete.", stage="startup")
 
 
+@etl_app.command("run")
+def run_etl(
+	full: bool = typer.Option(
+		False, help="Сбросить водяные знаки и загрузить все заново"
+	),
+) -> None:
+	"""Все шаги ETL одним процессом: DAG с общим пулом, независимые шаги параллельно.
+	Грузится только новое относительно водяных знаков (logistics.etl_watermark)"""
+	logger.info("Starting ETL pipeline...", full=full, stage="etl")
+	serve_etl_metrics()
+	asyncio.run(run_etl_pipeline(full))
+
+
+@etl_app.command("partitions")
+def run_partitions() -> None:
+	"""Дневные партиции истории вперед и удаление старых (HISTORY_RETENTION_DAYS)"""
+	logger.info("Maintaining history partitions...", stage="etl")
+	asyncio.run(maintain_partitions())
+
+
+async def run_synth(spec: SynthSpec) -> None:
+	pool = await create_pool(cfg.pg_url)
+	try:
+		async with acquire_connection(pool) as conn:
+			await generate_synth(conn, spec)
+	finally:
+		await pool.close()
+
+
+@app.command("synth")
+def synth(
+	branches: int = typer.Option(20, min=1),
+	products: int = typer.Option(50, min=1),
+	days: int = typer.Option(10, min=1),
+	categories: int = typer.Option(10, min=1),
+	assortment: float = typer.Option(
+		0.5, min=0.0, max=1.0, help="Доля товаров в ассортименте филиала"
+	),
+	seed: int = typer.Option(cfg.etl_seed or 0),
+) -> None:
+	"""Детерминированный синтетический набор данных вместо CSV; заменяет все данные"""
+	spec = SynthSpec(branches, products, days, categories, assortment, seed)
+	logger.info("Generating synthetic dataset...", spec=str(spec), stage="etl")
+	serve_etl_metrics()
+	asyncio.run(run_synth(spec))
+
+
+async def run_export(
+	params: DistributionParams, output: Path, fmt: ExportFormat
+) -> None:
+	pool = await create_pool(cfg.pg_url)
+	try:
+		async with acquire_connection(pool) as conn:
+			await export_distribution(conn, params, output, fmt)
+	finally:
+		await pool.close()
+
+
+@app.command("distribution")
+def run_distribution(
+	output: Path,
+	date_from: datetime.datetime = typer.Option(None, formats=["%Y-%m-%d"]),
+	date_to: datetime.datetime = typer.Option(None, formats=["%Y-%m-%d"]),
+	allocation: Allocation = "independent",
+	respect_volume: bool = False,
+	profile: str = "default",
+	fmt: ExportFormat = typer.Option("csv", "--format", help="csv или ndjson"),
+) -> None:
+	"""Распределение за дату или диапазон дат одним запросом в CSV/NDJSON-файл"""
+	load_profiles(cfg.data_source_profiles)
+	try:
+		source = get_profile(profile)
+	except KeyError as exc:
+		raise typer.BadParameter(f"Unknown data source profile: '{profile}'") from exc
+	start = date_from.date() if date_from else datetime.date.today()
+	end = date_to.date() if date_to else None
+	if end is not None:
+		try:
+			check_date_range(start, end, cfg.distribution_max_days)
+		except ValueError as exc:
+			raise typer.BadParameter(str(exc)) from exc
+
+	params = DistributionParams(
+		date=start,
+		date_to=end,
+		allocation=allocation,
+		respect_volume=respect_volume,
+		source=source,
+	)
+	logger.info("Exporting distribution...", output=str(output), date_from=str(start))
+	asyncio.run(run_export(params, output, fmt))
+
+
+@bench_app.command("run")
+def run_bench(
+	output: Path,
+	repeat: int = typer.Option(5, min=1, help="Замеров на каждую форму расчета"),
+	etl_days: list[int] = typer.Option(
+		None,
+		help="Масштабы ETL в днях истории; перезаписывают данные базы",
+	),
+) -> None:
+	"""Замер расчета (комбинации флагов, режимы распределения, филиал, диапазон
+	дат, пакетный расчет) и ETL по шагам в JSON"""
+	logger.info("Running benchmarks...", output=str(output), stage="bench")
+	asyncio.run(run_suite(output, repeat, etl_days or []))
+
+
+@bench_app.command("compare")
+def compare_bench(
+	baseline: Path,
+	current: Path,
+	threshold: float = typer.Option(0.2, help="Допустимый рост медианы, доля"),
+	min_delta: float = typer.Option(0.005, help="Игнорировать рост меньше, секунды"),
+) -> None:
+	"""Сравнение с базовой линией; код выхода 1, если есть регрессии"""
+	comparisons = compare_results(
+		load_results(baseline), load_results(current), threshold, min_delta
+	)
+	typer.echo(f"{'case':<60} {'baseline':>10} {'current':>10} {'change':>8}")
+	for item in comparisons:
+		before = f"{item.baseline:.4f}" if item.baseline is not None else "-"
+		after = f"{item.current:.4f}" if item.current is not None else "-"
+		change = f"{item.change:+.1%}" if item.change is not None else ""
+		mark = "REGRESSION" if item.regressed else ""
+		typer.echo(f"{item.name:<60} {before:>10} {after:>10} {change:>8} {mark}")
+
+	regressions = [item.name for item in comparisons if item.regressed]
+	if regressions:
+		logger.error("Benchmark regressions", cases=regressions, stage="bench")
+		raise typer.Exit(code=1)
+
+
 @app.command("ping-db")
 def ping_db() -> None:
 	"""Проверка, что конфиг валиден"""
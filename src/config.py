@@ -7,12 +7,121 @@ def str2bool(value: str) -> bool:
 	return value.lower() in {"1", "true", "yes", "on"}
 
 
+def str2float(value: str) -> float | None:
+	return float(value) if value else None
+
+
+def str2int(value: str) -> int | None:
+	return int(value) if value else None
+
+
 @dataclass(frozen=True, slots=True)
 class AppCfg:
 	pg_url: str = field(default_factory=lambda: os.getenv("POSTGRES_URL", ""))
 	production: bool = field(
 		default_factory=lambda: str2bool(os.getenv("PRODUCTION", "false"))
 	)
+	# пул asyncpg
+	pg_pool_min_size: int = field(
+		default_factory=lambda: int(os.getenv("PG_POOL_MIN_SIZE", "10"))
+	)
+	pg_pool_max_size: int = field(
+		default_factory=lambda: int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+	)
+	pg_max_queries: int = field(
+		default_factory=lambda: int(os.getenv("PG_MAX_QUERIES", "50000"))
+	)
+	pg_max_inactive_lifetime: float = field(
+		default_factory=lambda: float(os.getenv("PG_MAX_INACTIVE_LIFETIME", "300"))
+	)
+	# LRU-кэш statements соединения: горячие формы профиля по умолчанию
+	# прогреваются при открытии соединения, остальные готовятся при первом
+	# использовании; 0 — без кэша и без прогрева (pgbouncer)
+	pg_statement_cache_size: int = field(
+		default_factory=lambda: int(os.getenv("PG_STATEMENT_CACHE_SIZE", "1024"))
+	)
+	# секунды, пусто — без таймаута на стороне клиента
+	pg_command_timeout: float | None = field(
+		default_factory=lambda: str2float(os.getenv("PG_COMMAND_TIMEOUT", ""))
+	)
+	# настройки сессии PostgreSQL, пусто — значение сервера
+	pg_work_mem: str = field(default_factory=lambda: os.getenv("PG_WORK_MEM", ""))
+	pg_jit: str = field(default_factory=lambda: os.getenv("PG_JIT", ""))
+	pg_statement_timeout: str = field(
+		default_factory=lambda: os.getenv("PG_STATEMENT_TIMEOUT", "")
+	)
+	# numeric -> float вместо Decimal в пуле API: быстрее декодирование,
+	# теряется точность; ETL не затрагивает
+	pg_numeric_as_float: bool = field(
+		default_factory=lambda: str2bool(os.getenv("PG_NUMERIC_AS_FLOAT", "false"))
+	)
+	# uuid и numeric (если не float) -> str в пуле API: ответ собирается
+	# без UUID/Decimal; ETL не затрагивает — его COPY нужны бинарные кодеки
+	pg_text_codecs: bool = field(
+		default_factory=lambda: str2bool(os.getenv("PG_TEXT_CODECS", "false"))
+	)
+	# дневные партиции истории: сколько создавать вперед и сколько дней хранить
+	history_partitions_ahead: int = field(
+		default_factory=lambda: int(os.getenv("HISTORY_PARTITIONS_AHEAD", "7"))
+	)
+	# 0 — хранить всё
+	history_retention_days: int = field(
+		default_factory=lambda: int(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+	)
+	# сид генераторов ETL и synth, пусто — каждый запуск дает новые данные
+	etl_seed: int | None = field(
+		default_factory=lambda: str2int(os.getenv("ETL_SEED", ""))
+	)
+	# needs/logdays/min_shipment/storage_limits одним INSERT ... SELECT в базе;
+	# false — прежний путь через Python (fetch, расчет, COPY)
+	etl_server_generation: bool = field(
+		default_factory=lambda: str2bool(os.getenv("ETL_SERVER_GENERATION", "true"))
+	)
+	# порт /metrics процесса ETL (etl run, synth), пусто — метрики не отдаются
+	etl_metrics_port: int | None = field(
+		default_factory=lambda: str2int(os.getenv("ETL_METRICS_PORT", ""))
+	)
+	# строк CSV на загрузку истории (филиалы / РЦ), пусто — файл целиком:
+	# загрузка потоковая, память от размера файла не зависит
+	etl_branch_rows: int | None = field(
+		default_factory=lambda: str2int(os.getenv("ETL_BRANCH_ROWS", "500"))
+	)
+	etl_rc_rows: int | None = field(
+		default_factory=lambda: str2int(os.getenv("ETL_RC_ROWS", "300"))
+	)
+	# дополнительные профили источников данных, JSON {"name": {"schema": ...}}
+	data_source_profiles: str = field(
+		default_factory=lambda: os.getenv("DATA_SOURCE_PROFILES", "")
+	)
+	# максимальный диапазон date_from..date_to в одном запросе /distribution
+	distribution_max_days: int = field(
+		default_factory=lambda: int(os.getenv("DISTRIBUTION_MAX_DAYS", "31"))
+	)
+	# JSON /distribution через orjson из записей, без pydantic-моделей строк
+	distribution_fast_json: bool = field(
+		default_factory=lambda: str2bool(os.getenv("DISTRIBUTION_FAST_JSON", "true"))
+	)
+	# бюджет LRU-кэша /distribution в строках результата, 0 — кэш выключен
+	distribution_cache_rows: int = field(
+		default_factory=lambda: int(os.getenv("DISTRIBUTION_CACHE_ROWS", "200000"))
+	)
+	# секунды жизни кэша метаданных /manage (схемы, таблицы), 0 — без кэша
+	manage_cache_ttl: float = field(
+		default_factory=lambda: float(os.getenv("MANAGE_CACHE_TTL", "300"))
+	)
+
+	# оценка планировщика, выше которой запрос /distribution отклоняется, 0 — без
+	distribution_max_cost: float = field(
+		default_factory=lambda: float(os.getenv("DISTRIBUTION_MAX_COST", "0"))
+	)
+	# запросы дольше порога (секунды, 0 — выключено) пишутся в лог; у доли
+	# sample_rate из них auto_explain пишет в лог PostgreSQL план выполнения
+	slow_query_seconds: float = field(
+		default_factory=lambda: float(os.getenv("SLOW_QUERY_SECONDS", "0"))
+	)
+	slow_query_sample_rate: float = field(
+		default_factory=lambda: float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "0.1"))
+	)
 
 	def __post_init__(self) -> None:
 		parsed = urlparse(self.pg_url)
@@ -28,5 +137,22 @@ class AppCfg:
 		if not parsed.hostname or not parsed.path:
 			raise ValueError("Incomplete POSTGRES_URL: missing host or database name.")
 
+		if not 0 <= self.pg_pool_min_size <= self.pg_pool_max_size:
+			raise ValueError(
+				"PG_POOL_MIN_SIZE must be between 0 and PG_POOL_MAX_SIZE, "
+				f"got {self.pg_pool_min_size} > {self.pg_pool_max_size}"
+			)
+
+	@property
+	def pg_server_settings(self) -> dict[str, str]:
+		"""Передаются в стартовом пакете соединения, без лишних round trip"""
+		settings = {
+			"application_name": "dns_task",
+			"work_mem": self.pg_work_mem,
+			"jit": self.pg_jit,
+			"statement_timeout": self.pg_statement_timeout,
+		}
+		return {name: value for name, value in settings.items() if value}
+
 
 cfg = AppCfg()
@@ -1,18 +1,101 @@
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Awaitable, Callable, Sequence
 from contextlib import asynccontextmanager
 
 import asyncpg
+import structlog
 
+from config import AppCfg, cfg
+from core.metrics import ACQUIRE_SECONDS, POOL_WAITERS, observe
 
-async def create_pool(url: str) -> asyncpg.Pool:
-	pool = await asyncpg.create_pool(dsn=url)
+logger = structlog.get_logger()
+
+ConnectionHook = Callable[[asyncpg.Connection], Awaitable[None]]
+
+
+async def setup_codecs(conn: asyncpg.Connection, settings: AppCfg = cfg) -> None:
+	"""init-хук пула API (PG_NUMERIC_AS_FLOAT). Пулам ETL не ставится:
+	бинарный COPY в numeric-колонки не работает с текстовым кодеком"""
+	if settings.pg_numeric_as_float:
+		await conn.set_type_codec(
+			"numeric",
+			schema="pg_catalog",
+			encoder=str,
+			decoder=float,
+			format="text",
+		)
+
+
+async def setup_text_codecs(conn: asyncpg.Connection, settings: AppCfg = cfg) -> None:
+	"""init-хук пула API (PG_TEXT_CODECS): значения приходят готовыми строками
+	текстового протокола, orjson кладет их в ответ как есть"""
+	codecs = ["uuid"] if settings.pg_numeric_as_float else ["uuid", "numeric"]
+	for name in codecs:
+		await conn.set_type_codec(
+			name, schema="pg_catalog", encoder=str, decoder=str, format="text"
+		)
+
+
+async def setup_auto_explain(conn: asyncpg.Connection, settings: AppCfg = cfg) -> None:
+	"""init-хук пула API (SLOW_QUERY_SECONDS): auto_explain пишет в лог
+	PostgreSQL план медленного запроса с фактическими временами и буферами.
+	LOAD доступен суперпользователю или из $libdir/plugins; иначе медленные
+	запросы попадают только в лог приложения, без плана"""
+	try:
+		await conn.execute("LOAD 'auto_explain'")
+	except (asyncpg.InsufficientPrivilegeError, asyncpg.UndefinedFileError) as exc:
+		logger.warning("auto_explain is not available", error=str(exc), stage="startup")
+		return
+	await conn.execute(
+		"""
+		SELECT
+			set_config('auto_explain.log_min_duration', $1, false),
+			set_config('auto_explain.sample_rate', $2, false),
+			set_config('auto_explain.log_analyze', 'on', false),
+			set_config('auto_explain.log_buffers', 'on', false),
+			set_config('auto_explain.log_format', 'json', false)
+		""",
+		str(round(settings.slow_query_seconds * 1000)),
+		str(settings.slow_query_sample_rate),
+	)
+
+
+async def create_pool(
+	url: str,
+	init: Sequence[ConnectionHook] = (),
+	settings: AppCfg = cfg,
+) -> asyncpg.Pool:
+	"""init — хуки на каждое новое соединение (кодеки, настройки сессии)"""
+
+	async def init_connection(conn: asyncpg.Connection) -> None:
+		for hook in init:
+			await hook(conn)
+
+	pool = await asyncpg.create_pool(
+		dsn=url,
+		min_size=settings.pg_pool_min_size,
+		max_size=settings.pg_pool_max_size,
+		max_queries=settings.pg_max_queries,
+		max_inactive_connection_lifetime=settings.pg_max_inactive_lifetime,
+		statement_cache_size=settings.pg_statement_cache_size,
+		command_timeout=settings.pg_command_timeout,
+		server_settings=settings.pg_server_settings,
+		init=init_connection,
+	)
+	logger.debug(
+		"Pool created",
+		min_size=settings.pg_pool_min_size,
+		max_size=settings.pg_pool_max_size,
+		server_settings=settings.pg_server_settings,
+		stage="startup",
+	)
 	return pool
 
 
 @asynccontextmanager
 async def acquire_connection(pool: asyncpg.Pool) -> AsyncGenerator[asyncpg.Connection]:
 	"""context func to safely work with pool"""
-	conn = await pool.acquire()
+	with POOL_WAITERS.track_inprogress(), observe(ACQUIRE_SECONDS):
+		conn = await pool.acquire()
 	try:
 		yield conn
 	finally:
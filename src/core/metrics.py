@@ -0,0 +1,120 @@
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import asyncpg
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+
+from core.workflow.dataclasses import DistributionParams
+
+# от 1 мс до 30 с: acquire обычно быстрый, расчет с учетом объема — секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LABELS = ("endpoint", "shape")
+
+ACQUIRE_SECONDS = Histogram(
+	"dns_task_pool_acquire_seconds", "Ожидание соединения пула", LABELS, buckets=BUCKETS
+)
+QUERY_SECONDS = Histogram(
+	"dns_task_query_seconds", "Выполнение запроса расчета", LABELS, buckets=BUCKETS
+)
+MODEL_SECONDS = Histogram(
+	"dns_task_model_seconds", "Сборка моделей строк ответа", LABELS, buckets=BUCKETS
+)
+SERIALIZE_SECONDS = Histogram(
+	"dns_task_serialize_seconds", "Сериализация ответа", LABELS, buckets=BUCKETS
+)
+POOL_WAITERS = Gauge("dns_task_pool_waiters", "Корутины в ожидании соединения")
+
+ETL_ROWS = Counter("dns_task_etl_rows", "Строки, записанные COPY", ("table",))
+ETL_SECONDS = Counter("dns_task_etl_copy_seconds", "Время COPY", ("table",))
+
+# метки текущего запроса; вне HTTP-запросов (ETL, CLI) — прочерки
+request_labels: ContextVar[tuple[str, str]] = ContextVar(
+	"request_labels", default=("-", "-")
+)
+
+
+def filter_shape(params: DistributionParams) -> str:
+	"""Форма запроса без значений фильтров — ограниченная кардинальность меток"""
+	flags = {
+		"range": params.date_to is not None,
+		"branch": params.branch_id is not None,
+		"product": params.product_id is not None,
+		"category": params.category_id is not None,
+		"min_demand": params.min_demand is not None,
+		"volume": params.respect_volume,
+		"limit": params.limit is not None,
+	}
+	return ",".join([params.allocation, *(name for name, on in flags.items() if on)])
+
+
+def set_request_labels(endpoint: str, params: DistributionParams) -> None:
+	request_labels.set((endpoint, filter_shape(params)))
+
+
+@contextmanager
+def observe(histogram: Histogram) -> Iterator[None]:
+	started = time.perf_counter()
+	try:
+		yield
+	finally:
+		histogram.labels(*request_labels.get()).observe(time.perf_counter() - started)
+
+
+class StreamTimer:
+	"""Потоковые ответы: ожидание строк курсора — запрос, остальное — сериализация"""
+
+	def __init__(self) -> None:
+		# метки берутся в обработчике: тело ответа читается уже после него
+		self.labels = request_labels.get()
+		self.waiting = 0.0
+
+	async def records(
+		self, records: AsyncIterable[asyncpg.Record]
+	) -> AsyncIterator[asyncpg.Record]:
+		iterator = aiter(records)
+		while True:
+			started = time.perf_counter()
+			try:
+				record = await anext(iterator)
+			except StopAsyncIteration:
+				return
+			finally:
+				self.waiting += time.perf_counter() - started
+			yield record
+
+	def finish(self, total: float) -> None:
+		QUERY_SECONDS.labels(*self.labels).observe(self.waiting)
+		SERIALIZE_SECONDS.labels(*self.labels).observe(max(total - self.waiting, 0.0))
+
+	async def chunks[T](self, chunks: AsyncIterable[T]) -> AsyncIterator[T]:
+		started = time.perf_counter()
+		async for chunk in chunks:
+			yield chunk
+		self.finish(time.perf_counter() - started)
+
+
+class PoolCollector(Collector):
+	"""Гейджи пула снимаются в момент scrape, без фоновых задач"""
+
+	def __init__(self, pool: asyncpg.Pool) -> None:
+		self._pool = pool
+
+	def collect(self) -> Iterator[GaugeMetricFamily]:
+		size, idle = self._pool.get_size(), self._pool.get_idle_size()
+		for name, doc, value in (
+			("size", "Открытые соединения пула", size),
+			("idle", "Свободные соединения пула", idle),
+			("in_use", "Занятые соединения пула", size - idle),
+			("max_size", "Максимальный размер пула", self._pool.get_max_size()),
+		):
+			yield GaugeMetricFamily(f"dns_task_pool_{name}", doc, value=value)
+
+
+def register_pool(pool: asyncpg.Pool) -> PoolCollector:
+	collector = PoolCollector(pool)
+	REGISTRY.register(collector)
+	return collector
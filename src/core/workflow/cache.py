@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import asyncpg
+import structlog
+
+from core.workflow.version import DATA_CHANNEL, SCHEMA_CHANNEL, get_data_version
+
+logger = structlog.get_logger()
+
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+def _weight(value: Sequence[Any]) -> int:
+	# пустой результат тоже занимает место в бюджете
+	return max(len(value), 1)
+
+
+class DistributionCache:
+	"""LRU результатов calculate_distribution с бюджетом по числу строк.
+
+	Записи валидны только для текущей версии данных; версию двигает
+	DataVersionWatcher по NOTIFY. Пока версия неизвестна (нет LISTEN-соединения),
+	кэш ничего не отдает и не сохраняет.
+	"""
+
+	def __init__(self, max_rows: int) -> None:
+		self.max_rows = max_rows
+		self.version: int | None = None
+		self._rows = 0
+		self._entries: OrderedDict[Hashable, Sequence[Any]] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def get(self, key: Hashable) -> Sequence[Any] | None:
+		if self.version is None:
+			return None
+		value = self._entries.get(key)
+		if value is not None:
+			self._entries.move_to_end(key)
+		return value
+
+	def put(self, key: Hashable, value: Sequence[Any], version: int | None) -> None:
+		"""version — версия, снятая до выполнения запроса: если за время запроса
+		пришла инвалидация, результат устарел и не кэшируется"""
+		if version is None or version != self.version or _weight(value) > self.max_rows:
+			return
+		if key in self._entries:
+			self._rows -= _weight(self._entries.pop(key))
+		self._entries[key] = value
+		self._rows += _weight(value)
+		while self._rows > self.max_rows:
+			_, evicted = self._entries.popitem(last=False)
+			self._rows -= _weight(evicted)
+
+	def invalidate(self, version: int | None) -> None:
+		if version is not None and version == self.version:
+			return
+		self._entries.clear()
+		self._rows = 0
+		self.version = version
+
+
+@dataclass(frozen=True, slots=True)
+class CachedBody:
+	body: bytes
+	etag: str
+
+	@classmethod
+	def of(cls, body: bytes) -> "CachedBody":
+		return cls(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+class MetadataCache:
+	"""Готовые тела ответов /manage по ключу с TTL; сбрасывается по NOTIFY
+	после миграций. Одновременные промахи по ключу ждут одну загрузку"""
+
+	def __init__(self, ttl: float) -> None:
+		self.ttl = ttl
+		self._entries: dict[Hashable, tuple[float, CachedBody]] = {}
+		self._loading: dict[Hashable, asyncio.Task[CachedBody]] = {}
+		# загрузка, начатая до сброса, не должна сохранить устаревший ответ
+		self._generation = 0
+
+	async def get(
+		self, key: Hashable, load: Callable[[], Awaitable[bytes]]
+	) -> CachedBody:
+		if self.ttl <= 0:
+			return CachedBody.of(await load())
+		entry = self._entries.get(key)
+		if entry and entry[0] > time.monotonic():
+			return entry[1]
+
+		task = self._loading.get(key)
+		if task is None:
+			task = asyncio.create_task(self._load(key, load, self._generation))
+			self._loading[key] = task
+			task.add_done_callback(lambda done: self._forget(key, done))
+		# отмена одного запроса не должна отменять загрузку для остальных
+		return await asyncio.shield(task)
+
+	def invalidate(self) -> None:
+		self._entries.clear()
+		self._loading.clear()
+		self._generation += 1
+
+	async def _load(
+		self, key: Hashable, load: Callable[[], Awaitable[bytes]], generation: int
+	) -> CachedBody:
+		cached = CachedBody.of(await load())
+		if generation == self._generation:
+			self._entries[key] = (time.monotonic() + self.ttl, cached)
+		return cached
+
+	def _forget(self, key: Hashable, task: asyncio.Task[CachedBody]) -> None:
+		if self._loading.get(key) is task:
+			del self._loading[key]
+
+
+class DataVersionWatcher:
+	"""Отдельное LISTEN-соединение на воркер: сбрасывает кэш при каждом bump
+	версии данных, а кэш метаданных — при изменении схемы; переподключается
+	при обрыве"""
+
+	def __init__(
+		self,
+		url: str,
+		cache: DistributionCache,
+		metadata_cache: MetadataCache | None = None,
+	) -> None:
+		self.url = url
+		self.cache = cache
+		self.metadata_cache = metadata_cache
+		self._conn: asyncpg.Connection | None = None
+		self._reconnect: asyncio.Task[None] | None = None
+		self._closed = False
+
+	async def start(self) -> None:
+		conn = await asyncpg.connect(self.url)
+		conn.add_termination_listener(self._on_terminate)
+		await conn.add_listener(DATA_CHANNEL, self._on_notify)
+		await conn.add_listener(SCHEMA_CHANNEL, self._on_schema_notify)
+		# версию читаем уже после LISTEN, чтобы не пропустить bump между ними
+		self.cache.invalidate(await get_data_version(conn))
+		if self.metadata_cache:
+			# пока соединения не было, изменения схемы могли пройти мимо
+			self.metadata_cache.invalidate()
+		self._conn = conn
+		logger.info("Listening for data version changes", version=self.cache.version)
+
+	async def close(self) -> None:
+		self._closed = True
+		if self._reconnect:
+			self._reconnect.cancel()
+		if self._conn and not self._conn.is_closed():
+			await self._conn.close()
+
+	def _on_notify(
+		self, conn: asyncpg.Connection, pid: int, channel: str, payload: str
+	) -> None:
+		logger.info("Data version changed, cache invalidated", version=payload)
+		self.cache.invalidate(int(payload))
+
+	def _on_schema_notify(
+		self, conn: asyncpg.Connection, pid: int, channel: str, payload: str
+	) -> None:
+		if self.metadata_cache:
+			logger.info("Schema changed, metadata cache invalidated")
+			self.metadata_cache.invalidate()
+
+	def _on_terminate(self, conn: asyncpg.Connection) -> None:
+		self.cache.invalidate(None)
+		if self._closed:
+			return
+		logger.warning("Data version listener lost, cache disabled")
+		self._reconnect = asyncio.get_running_loop().create_task(self._reconnect_loop())
+
+	async def _reconnect_loop(self) -> None:
+		delay = RECONNECT_DELAY
+		while not self._closed:
+			await asyncio.sleep(delay)
+			try:
+				await self.start()
+				return
+			except (OSError, asyncpg.PostgresError) as exc:
+				logger.warning("Data version listener reconnect failed", error=str(exc))
+				delay = min(delay * 2, MAX_RECONNECT_DELAY)
@@ -1,140 +1,477 @@
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass
 from datetime import date as Date
 from typing import Any
-from uuid import UUID
 
 import asyncpg
 import structlog
 
+from core.workflow.dataclasses import (
+	Allocation,
+	DataSourceProfile,
+	DistributionFilter,
+	DistributionParams,
+	PackingOrder,
+)
+
 logger = structlog.get_logger()
 
+# qty по режиму распределения поверх allocation_base b;
+# окна считаются до фильтров, поэтому доля филиала не зависит от выборки
+ALLOCATION_QTY: dict[Allocation, str] = {
+	"independent": "LEAST(b.demand, b.available)",
+	# всем одна и та же доля спроса, при дефиците — available / суммарный спрос
+	"proportional": (
+		"b.demand * LEAST(1, COALESCE(b.available / NULLIF(SUM(b.demand) OVER per_product, 0), 1))"
+	),
+	# очередь по убыванию спроса: каждому то, что осталось после предыдущих
+	"greedy": (
+		"GREATEST(LEAST(b.demand, b.available - (SUM(b.demand) OVER queue - b.demand)), 0)"
+	),
+	# сначала min_qty всем (пропорционально при дефиците), остаток — очередью
+	"priority": """b.min_share + GREATEST(LEAST(
+                    b.demand - b.min_share,
+                    b.available - SUM(b.min_share) OVER per_product
+                        - (SUM(b.demand - b.min_share) OVER queue - (b.demand - b.min_share))
+                ), 0)""",
+}
 
-async def calculate_distribution(
-	conn: asyncpg.Connection,
-	date: Date | None = None,
-	branch_id: UUID | None = None,
-	product_id: UUID | None = None,
-	category_id: UUID | None = None,
-	min_demand: float | None = None,
-	respect_volume: bool = False,
-	limit: int | None = None,
-	schema: str = "logistics",
-	rc_table: str = "rc_product_history",
-	branch_table: str = "branch_product_history",
-	needs_table: str = "needs",
-	min_table: str = "min_shipment",
-	volume_table: str = "products_vol",
-	limit_table: str = "storage_limits",
-	product_table: str = "products",
-	logdays_table: str = "logdays",
-) -> list[asyncpg.Record]:
-	date = date or Date.today()
-	args: list[Any] = [date]
+PACKING_ORDER: dict[PackingOrder, str] = {
+	"demand": "j.demand DESC",
+	# спрос на м³ единицы товара: при нехватке места первыми идут компактные
+	# товары. Строки без объема места не занимают (qty целиком), поэтому их
+	# место в очереди на остальных не влияет; NULLS FIRST лишь фиксирует порядок
+	"density": "j.demand / NULLIF(v.volume_per_unit, 0) DESC NULLS FIRST",
+}
+
+MIN_SHARE = """,
+                la.min_qty * LEAST(1, COALESCE(
+                    rc.available / NULLIF(SUM(la.min_qty) OVER (PARTITION BY la.date, la.product_id), 0), 1
+                )) AS min_share"""
+
+
+@dataclass(frozen=True, slots=True)
+class _DateScope:
+	"""Дата расчета ($1) или диапазон ($1..$2): во втором случае все
+	датозависимые CTE размножаются по дням из days, а needs, min_shipment,
+	logdays и products читаются один раз на весь диапазон"""
+
+	is_range: bool
+
+	@property
+	def day(self) -> str:
+		return "days.date" if self.is_range else "$1::date"
+
+	@property
+	def days_join(self) -> str:
+		return "CROSS JOIN days" if self.is_range else ""
+
+	def match(self, column: str) -> str:
+		"""Условие на дату для соединения: явный диапазон нужен, чтобы
+		отсечь партиции и строки вне диапазона еще до join с days"""
+		if self.is_range:
+			return f"{column} = days.date AND {column} BETWEEN $1 AND $2"
+		return f"{column} = $1"
+
+	def within(self, column: str) -> str:
+		return f"{column} BETWEEN $1 AND $2" if self.is_range else f"{column} = $1"
+
+
+def _free_volume_cte(src: DataSourceProfile, scope: _DateScope) -> str:
+	if src.branch_volume_table:
+		return f"""
+            SELECT
+                {scope.day} AS date,
+                sl.branch_id,
+                sl.max_volume - COALESCE(bv.occupied_volume, 0) AS available_volume
+            FROM {src.schema}.{src.limit_table} sl
+            {scope.days_join}
+            LEFT JOIN {src.schema}.{src.branch_volume_table} bv
+                ON bv.branch_id = sl.branch_id AND {scope.match("bv.date")}
+        """  # noqa: S608
+	return f"""
+        SELECT
+            {scope.day} AS date,
+            sl.branch_id,
+            sl.max_volume - COALESCE(SUM(h.stock * pv.volume_per_unit), 0) AS available_volume
+        FROM {src.schema}.{src.limit_table} sl
+        {scope.days_join}
+        LEFT JOIN {src.schema}.{src.branch_table} h
+            ON h.branch_id = sl.branch_id AND {scope.match("h.date")}
+        LEFT JOIN {src.schema}.{src.volume_table} pv
+            ON h.product_id = pv.product_id
+        GROUP BY 1, sl.branch_id, sl.max_volume
+    """  # noqa: S608
+
+
+def _rc_available_cte(src: DataSourceProfile, scope: _DateScope) -> str:
+	if src.rc_available_table:
+		return f"""
+            SELECT date, product_id, available
+            FROM {src.schema}.{src.rc_available_table}
+            WHERE {scope.within("date")}
+        """  # noqa: S608
+	return f"""
+        SELECT
+            date,
+            product_id,
+            SUM(stock - reserved - in_transit) AS available
+        FROM {src.schema}.{src.rc_table}
+        WHERE {scope.within("date")}
+        GROUP BY date, product_id
+    """  # noqa: S608
+
+
+def _packed_cte(src: DataSourceProfile, pack_by: PackingOrder) -> str:
+	"""Укладка строк филиала в его свободный объем нарастающим итогом;
+	строка на границе получает остаток объема, следующие — ничего"""
+	return f"""
+        SELECT
+            j.date,
+            j.branch_id,
+            j.product_id,
+            j.demand,
+            j.min_qty,
+            j.available,
+            CASE
+                WHEN v.volume_per_unit = 0 THEN j.qty
+                ELSE LEAST(j.qty, GREATEST(
+                    fv.available_volume - (SUM(j.qty * v.volume_per_unit) OVER packing
+                        - j.qty * v.volume_per_unit), 0
+                ) / v.volume_per_unit)
+            END AS qty,
+            j.logdays,
+            j.qty AS allocated_qty
+        FROM joined j
+        JOIN {src.schema}.{src.volume_table} v ON j.product_id = v.product_id
+        JOIN free_volume fv ON j.branch_id = fv.branch_id AND j.date = fv.date
+        WINDOW packing AS (
+            PARTITION BY j.date, j.branch_id ORDER BY {PACKING_ORDER[pack_by]}, j.product_id
+            ROWS UNBOUNDED PRECEDING
+        )
+    """  # noqa: S608
+
+
+def _filters(
+	params: DistributionParams, param_index: int
+) -> tuple[list[str], list[str], list[Any]]:
+	"""Фильтры выборки: (joins, conditions, args) начиная с $param_index"""
+	src = params.source
 	conditions = []
 	joins = []
-	cte_volume = ""
-	param_index = 2
+	args: list[Any] = []
 
-	if branch_id:
+	if params.branch_id:
 		conditions.append(f"j.branch_id = ${param_index}")
-		args.append(branch_id)
+		args.append(params.branch_id)
 		param_index += 1
-	if product_id:
+	if params.product_id:
 		conditions.append(f"j.product_id = ${param_index}")
-		args.append(product_id)
+		args.append(params.product_id)
 		param_index += 1
-	if category_id:
-		joins.append(f"JOIN {schema}.{product_table} p ON j.product_id = p.product_id")
+	if params.category_id:
+		joins.append(
+			f"JOIN {src.schema}.{src.product_table} p ON j.product_id = p.product_id"
+		)
 		conditions.append(f"p.category_id = ${param_index}")
-		args.append(category_id)
+		args.append(params.category_id)
 		param_index += 1
-	if min_demand is not None:
+	if params.min_demand is not None:
 		conditions.append(f"j.demand >= ${param_index}")
-		args.append(min_demand)
+		args.append(params.min_demand)
 		param_index += 1
+	if params.after:
+		# keyset-пагинация по ORDER BY product_id, branch_id
+		conditions.append(
+			f"(j.product_id, j.branch_id) > (${param_index}, ${param_index + 1})"
+		)
+		args.extend(params.after)
+		param_index += 2
+	if params.respect_volume:
+		# строки, на которые не осталось объема, не отгружаются вовсе
+		conditions.append("(j.qty > 0 OR j.allocated_qty = 0)")
 
-	if respect_volume:
-		cte_volume = f"""
-            , free_volume AS (
-                SELECT
-                    sl.branch_id,
-                    sl.max_volume - COALESCE(SUM(h.stock * pv.volume_per_unit), 0) AS available_volume
-                FROM {schema}.{limit_table} sl
-                LEFT JOIN {schema}.{branch_table} h
-                    ON h.branch_id = sl.branch_id AND h.date = $1
-                LEFT JOIN {schema}.{volume_table} pv
-                    ON h.product_id = pv.product_id
-                GROUP BY sl.branch_id, sl.max_volume
-            )
-        """  # noqa: S608
-		joins.append(f"JOIN {schema}.{volume_table} v ON j.product_id = v.product_id")
-		joins.append("JOIN free_volume fv ON j.branch_id = fv.branch_id")
-		conditions.append("j.qty * v.volume_per_unit <= fv.available_volume")
+	return joins, conditions, args
 
-	query = f"""
-        WITH rc_available AS (
-            SELECT
-                product_id,
-                SUM(stock - reserved - in_transit) AS available
-            FROM {schema}.{rc_table}
-            WHERE date = $1
-            GROUP BY product_id
-        ),
+
+def _date_args(params: DistributionParams) -> list[Any]:
+	"""$1 — дата (или начало диапазона), $2 — конец диапазона"""
+	args: list[Any] = [params.date or Date.today()]
+	if params.date_to is not None:
+		args.append(params.date_to)
+	return args
+
+
+def _shared_ctes(
+	params: DistributionParams, materialized: bool | None = None
+) -> tuple[str, str]:
+	"""Цепочка CTE расчета без фильтров выборки: (WITH ..., имя итогового CTE).
+
+	Использует только $1/$2 из _date_args, поэтому одна и та же цепочка
+	годится и для обычного запроса, и для пакетного. materialized задает
+	материализацию joined явно (None — на усмотрение планировщика).
+	"""
+	src = params.source
+	scope = _DateScope(is_range=params.date_to is not None)
+	cte_days = ""
+	if scope.is_range:
+		cte_days = (
+			"days AS (SELECT generate_series($1::date, $2::date, INTERVAL '1 day')::date"
+			" AS date),"
+		)
+
+	cte_volume = ""
+	source = "joined"
+	if params.respect_volume:
+		# укладка до фильтров: строки вне выборки тоже занимают объем филиала
+		cte_volume = (
+			f", free_volume AS ({_free_volume_cte(src, scope)}),"
+			f" packed AS ({_packed_cte(src, params.pack_by)})"
+		)
+		source = "packed"
+
+	joined_hint = {None: "", True: "MATERIALIZED ", False: "NOT MATERIALIZED "}[
+		materialized
+	]
+	ctes = f"""
+        WITH {cte_days}
+
+        rc_available AS ({_rc_available_cte(src, scope)}),
 
         branch_demand AS (
             SELECT
+                {scope.day} AS date,
                 n.branch_id,
                 n.product_id,
                 GREATEST(n.needs - COALESCE(h.stock, 0) - COALESCE(h.in_transit, 0), 0) AS base_demand
-            FROM {schema}.{needs_table} n
-            LEFT JOIN {schema}.{branch_table} h
-                ON h.branch_id = n.branch_id AND h.product_id = n.product_id AND h.date = $1
+            FROM {src.schema}.{src.needs_table} n
+            {scope.days_join}
+            LEFT JOIN {src.schema}.{src.branch_table} h
+                ON h.branch_id = n.branch_id AND h.product_id = n.product_id
+                AND {scope.match("h.date")}
         ),
 
         demand_with_min AS (
             SELECT
+                bd.date,
                 bd.branch_id,
                 bd.product_id,
                 GREATEST(bd.base_demand, m.min_qty) AS demand,
                 m.min_qty
             FROM branch_demand bd
-            JOIN {schema}.{min_table} m
+            JOIN {src.schema}.{src.min_table} m
                 ON m.branch_id = bd.branch_id AND m.product_id = bd.product_id
         ),
 
         logdays_adjusted AS (
             SELECT
+                d.date,
                 d.branch_id,
                 d.product_id,
                 d.demand * (1 + COALESCE(ld.logdays, 7)::float / 30.0) AS adjusted_demand,
                 d.min_qty,
 				ld.logdays AS logdays
             FROM demand_with_min d
-			LEFT JOIN {schema}.{product_table} p ON d.product_id = p.product_id
-            LEFT JOIN {schema}.{logdays_table} ld
+			LEFT JOIN {src.schema}.{src.product_table} p ON d.product_id = p.product_id
+            LEFT JOIN {src.schema}.{src.logdays_table} ld
 				ON d.branch_id = ld.branch_id AND p.category_id = ld.category_id
         ),
 
-        joined AS (
+        allocation_base AS (
             SELECT
+                la.date,
                 la.branch_id,
                 la.product_id,
-                la.adjusted_demand as demand,
+                la.adjusted_demand AS demand,
                 la.min_qty,
                 rc.available,
-                LEAST(la.adjusted_demand, rc.available) AS qty,
-				la.logdays as logdays
+                la.logdays{MIN_SHARE if params.allocation == "priority" else ""}
             FROM logdays_adjusted la
-            JOIN rc_available rc USING (product_id)
+            JOIN rc_available rc USING (date, product_id)
             WHERE rc.available > 0
+        ),
+
+        joined AS {joined_hint}(
+            SELECT
+                b.date,
+                b.branch_id,
+                b.product_id,
+                b.demand,
+                b.min_qty,
+                b.available,
+                {ALLOCATION_QTY[params.allocation]} AS qty,
+				b.logdays
+            FROM allocation_base b
+            WINDOW
+                per_product AS (PARTITION BY b.date, b.product_id),
+                queue AS (
+                    PARTITION BY b.date, b.product_id ORDER BY b.demand DESC, b.branch_id
+                    ROWS UNBOUNDED PRECEDING
+                )
         )
         {cte_volume}
+    """  # noqa: S608
+	return ctes, source
 
-        SELECT j.*
-        FROM joined j
+
+def build_distribution_query(params: DistributionParams) -> tuple[str, list[Any]]:
+	"""SQL и аргументы расчета распределения.
+
+	Текст запроса зависит только от источника и набора активных фильтров
+	(формы запроса), значения фильтров всегда идут параметрами.
+	"""
+	ctes, source = _shared_ctes(params)
+	args = _date_args(params)
+	joins, conditions, filter_args = _filters(params, len(args) + 1)
+	args.extend(filter_args)
+
+	limit_clause = ""
+	if params.limit:
+		args.append(params.limit)
+		limit_clause = f"LIMIT ${len(args)}"
+
+	query = f"""
+        {ctes}
+        SELECT
+            j.date, j.branch_id, j.product_id, j.demand, j.min_qty, j.available, j.qty, j.logdays
+        FROM {source} j
         {"\n".join(joins)}
         {"WHERE " + " AND ".join(conditions) if conditions else ""}
-        ORDER BY product_id, branch_id
-        {f"LIMIT {limit}" if limit else ""}
+        ORDER BY {"date, " if params.date_to else ""}product_id, branch_id
+        {limit_clause}
     """  # noqa: S608
 
+	return query, args
+
+
+def build_batch_query(
+	params: DistributionParams, filters: Sequence[DistributionFilter]
+) -> tuple[str, list[Any]]:
+	"""Один расчет на много наборов фильтров: наборы приходят массивами,
+	разворачиваются unnest в таблицу и соединяются с общей цепочкой CTE.
+
+	Общие параметры (дата, профиль, режимы) берутся из params, его
+	собственные фильтры не используются. Строки помечены request_key.
+	"""
+	src = params.source
+	# без окон строки независимы: join по branch_id/product_id проталкивается
+	# внутрь цепочки как индексный поиск; с окнами цепочка считается один раз
+	row_independent = params.allocation == "independent" and not params.respect_volume
+	ctes, source = _shared_ctes(params, materialized=not row_independent)
+	args = _date_args(params)
+	first = len(args) + 1
+	args.extend(
+		[
+			[f.key for f in filters],
+			[f.branch_id for f in filters],
+			[f.product_id for f in filters],
+			[f.category_id for f in filters],
+			[f.min_demand for f in filters],
+			[f.limit for f in filters],
+		]
+	)
+
+	# наборы делятся по самому селективному фильтру, чтобы соединение с
+	# цепочкой шло по равенству (hash join / индекс), а не перебором
+	products = f"{src.schema}.{src.product_table}"
+	arms = (
+		"JOIN filter_sets f ON j.branch_id = f.branch_id",
+		"JOIN filter_sets f ON j.product_id = f.product_id AND f.branch_id IS NULL",
+		f"""JOIN {products} pc ON j.product_id = pc.product_id
+            JOIN filter_sets f ON pc.category_id = f.category_id
+                AND f.branch_id IS NULL AND f.product_id IS NULL""",
+		"""JOIN filter_sets f ON f.branch_id IS NULL AND f.product_id IS NULL
+                AND f.category_id IS NULL""",
+	)
+	matched = "\n            UNION ALL\n".join(
+		f"""
+            SELECT
+                f.request_key,
+                f.product_id AS filter_product_id,
+                f.category_id AS filter_category_id,
+                f.min_demand AS filter_min_demand,
+                f.row_limit,
+                j.*
+            FROM {source} j
+            {arm}"""  # noqa: S608
+		for arm in arms
+	)
+	# остальные фильтры — после материализации, иначе планировщик протолкнет
+	# OR-условия в соединения и недооценит их кардинальность
+	conditions = [
+		"(m.filter_product_id IS NULL OR m.product_id = m.filter_product_id)",
+		"(m.filter_category_id IS NULL OR p.category_id = m.filter_category_id)",
+		"(m.filter_min_demand IS NULL OR m.demand >= m.filter_min_demand)",
+	]
+	if params.respect_volume:
+		conditions.append("(m.qty > 0 OR m.allocated_qty = 0)")
+
+	query = f"""
+        {ctes},
+
+        filter_sets AS (
+            SELECT *
+            FROM unnest(
+                ${first}::text[], ${first + 1}::uuid[], ${first + 2}::uuid[],
+                ${first + 3}::uuid[], ${first + 4}::float8[], ${first + 5}::int[]
+            ) AS f(request_key, branch_id, product_id, category_id, min_demand, row_limit)
+        ),
+
+        matched AS MATERIALIZED ({matched}
+        ),
+
+        numbered AS (
+            SELECT
+                m.*,
+                ROW_NUMBER() OVER (
+                    PARTITION BY m.request_key ORDER BY m.date, m.product_id, m.branch_id
+                ) AS row_number
+            FROM matched m
+            LEFT JOIN {products} p ON m.product_id = p.product_id
+            WHERE {" AND ".join(conditions)}
+        )
+
+        SELECT
+            request_key,
+            date, branch_id, product_id, demand, min_qty, available, qty, logdays
+        FROM numbered
+        WHERE row_limit IS NULL OR row_number <= row_limit
+        ORDER BY request_key, date, product_id, branch_id
+    """  # noqa: S608
+	return query, args
+
+
+async def calculate_distribution(
+	conn: asyncpg.Connection, params: DistributionParams
+) -> list[asyncpg.Record]:
+	query, args = build_distribution_query(params)
 	return await conn.fetch(query, *args)
+
+
+async def stream_distribution(
+	conn: asyncpg.Connection, params: DistributionParams, prefetch: int = 1000
+) -> AsyncIterator[asyncpg.Record]:
+	"""Серверный курсор: в памяти держится не больше prefetch строк"""
+	query, args = build_distribution_query(params)
+	async with conn.transaction():
+		async for record in conn.cursor(query, *args, prefetch=prefetch):
+			yield record
+
+
+async def calculate_batch(
+	conn: asyncpg.Connection,
+	params: DistributionParams,
+	filters: Sequence[DistributionFilter],
+) -> dict[str, list[asyncpg.Record]]:
+	"""Результаты пакетного расчета по ключам наборов фильтров"""
+	query, args = build_batch_query(params, filters)
+	return group_batch(filters, await conn.fetch(query, *args))
+
+
+def group_batch(
+	filters: Sequence[DistributionFilter], records: Sequence[asyncpg.Record]
+) -> dict[str, list[asyncpg.Record]]:
+	results: dict[str, list[asyncpg.Record]] = {f.key: [] for f in filters}
+	for record in records:
+		results[record["request_key"]].append(record)
+	return results
@@ -1,4 +1,13 @@
 from dataclasses import dataclass
+from datetime import date as Date
+from typing import Literal
+from uuid import UUID
+
+# independent — каждая строка берет min(спрос, остаток РЦ) сама по себе (как раньше);
+# остальные режимы делят остаток РЦ между филиалами без перерасхода
+Allocation = Literal["independent", "proportional", "priority", "greedy"]
+# порядок укладки строк филиала в свободный объем: по спросу или по спросу на м³
+PackingOrder = Literal["demand", "density"]
 
 
 @dataclass(frozen=True, slots=True)
@@ -16,3 +25,64 @@ class TableMeta:
 @dataclass(frozen=True, slots=True)
 class SchemaMeta:
 	tables: list[TableMeta]
+
+
+@dataclass(frozen=True, slots=True)
+class DataSourceProfile:
+	"""Именованный набор таблиц-источников для расчета распределения.
+
+	rc_available_table/branch_volume_table — предрасчитанные агрегаты по датам;
+	None считает их на лету из rc_table/branch_table
+	"""
+
+	name: str = "default"
+	schema: str = "logistics"
+	rc_table: str = "rc_product_history"
+	branch_table: str = "branch_product_history"
+	needs_table: str = "needs"
+	min_table: str = "min_shipment"
+	volume_table: str = "products_vol"
+	limit_table: str = "storage_limits"
+	product_table: str = "products"
+	logdays_table: str = "logdays"
+	rc_available_table: str | None = "rc_available_daily"
+	branch_volume_table: str | None = "branch_volume_daily"
+
+
+@dataclass(frozen=True, slots=True)
+class DistributionParams:
+	"""Параметры calculate_distribution; hashable — годится как ключ кэша"""
+
+	date: Date | None = None
+	# режим диапазона: считаются все дни date..date_to, в строках есть date
+	date_to: Date | None = None
+	branch_id: UUID | None = None
+	product_id: UUID | None = None
+	category_id: UUID | None = None
+	min_demand: float | None = None
+	respect_volume: bool = False
+	allocation: Allocation = "independent"
+	pack_by: PackingOrder = "demand"
+	limit: int | None = None
+	# (product_id, branch_id) последней строки предыдущей страницы
+	after: tuple[UUID, UUID] | None = None
+	source: DataSourceProfile = DataSourceProfile()
+
+
+def check_date_range(date_from: Date, date_to: Date, max_days: int) -> None:
+	"""Общая проверка диапазона для API и CLI: ValueError с текстом для ответа"""
+	days = (date_to - date_from).days + 1
+	if not 1 <= days <= max_days:
+		raise ValueError(f"Date range must span 1..{max_days} days, got {days}")
+
+
+@dataclass(frozen=True, slots=True)
+class DistributionFilter:
+	"""Один набор фильтров пакетного расчета; key возвращается вместе со строками"""
+
+	key: str
+	branch_id: UUID | None = None
+	product_id: UUID | None = None
+	category_id: UUID | None = None
+	min_demand: float | None = None
+	limit: int | None = None
@@ -6,25 +6,40 @@ from core.workflow.dataclasses import FieldMeta, SchemaMeta, TableMeta
 
 
 async def get_schemas(conn: asyncpg.Connection) -> list[str]:
+	# pg_catalog вместо information_schema: без тяжелых представлений
+	# и проверок прав по каждой строке; видимость схем — как в schemata
 	QUERY = """
-        SELECT schema_name
-        FROM information_schema.schemata
-        WHERE schema_name IN ('logistics')
-        ORDER BY schema_name
+        SELECT nspname AS schema_name
+        FROM pg_catalog.pg_namespace
+        WHERE nspname IN ('logistics')
+            AND (
+                pg_has_role(nspowner, 'USAGE')
+                OR has_schema_privilege(oid, 'CREATE, USAGE')
+            )
+        ORDER BY nspname
     """
 	rows = await conn.fetch(QUERY)
 	return [row["schema_name"] for row in rows]
 
 
 async def get_schema_structure(conn: asyncpg.Connection, schema: str) -> SchemaMeta:
+	# таблицы (партиционированные — одной записью, без дневных партиций),
+	# представления и внешние таблицы; тип — без модификаторов, как data_type
 	QUERY = """
     SELECT
-        table_name,
-        column_name,
-        data_type
-    FROM information_schema.columns
-    WHERE table_schema = $1
-    ORDER BY table_name, ordinal_position
+        c.relname AS table_name,
+        a.attname AS column_name,
+        format_type(a.atttypid, NULL) AS data_type
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+    WHERE n.nspname = $1
+        AND c.relkind IN ('r', 'p', 'v', 'f')
+        AND NOT c.relispartition
+        AND a.attnum > 0
+        AND NOT a.attisdropped
+        AND has_column_privilege(c.oid, a.attnum, 'SELECT, INSERT, UPDATE, REFERENCES')
+    ORDER BY c.relname, a.attnum
     """
 	rows = await conn.fetch(QUERY, schema)
 
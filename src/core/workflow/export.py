@@ -0,0 +1,45 @@
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Literal
+
+import asyncpg
+import structlog
+
+from core.workflow.calc import stream_distribution
+from core.workflow.dataclasses import DistributionParams
+
+logger = structlog.get_logger()
+
+ExportFormat = Literal["csv", "ndjson"]
+
+
+async def export_distribution(
+	conn: asyncpg.Connection,
+	params: DistributionParams,
+	path: Path,
+	fmt: ExportFormat = "csv",
+) -> int:
+	"""Выгрузка распределения в файл через серверный курсор: бэкфилл за
+	диапазон дат не держит результат в памяти целиком"""
+	started = time.perf_counter()
+	rows = 0
+	with path.open("w", encoding="utf-8", newline="") as file:
+		writer = csv.writer(file)
+		async for record in stream_distribution(conn, params):
+			if fmt == "ndjson":
+				file.write(json.dumps(dict(record), default=str) + "\n")
+			else:
+				if not rows:
+					writer.writerow(record.keys())
+				writer.writerow(record.values())
+			rows += 1
+
+	logger.info(
+		"Distribution exported",
+		path=str(path),
+		rows=rows,
+		seconds=round(time.perf_counter() - started, 3),
+	)
+	return rows
@@ -0,0 +1,87 @@
+import json
+import time
+from typing import Any
+
+import asyncpg
+import structlog
+
+from config import cfg
+from core.metrics import QUERY_SECONDS, observe, request_labels
+
+logger = structlog.get_logger()
+
+Plan = list[dict[str, Any]]
+
+
+class QueryCostExceeded(Exception):
+	def __init__(self, cost: float, max_cost: float) -> None:
+		super().__init__(f"Estimated query cost {cost:.0f} exceeds {max_cost:.0f}")
+		self.cost = cost
+		self.max_cost = max_cost
+
+
+async def explain(
+	conn: asyncpg.Connection, query: str, args: list, analyze: bool = False
+) -> Plan:
+	"""Без analyze — только планирование. С analyze запрос выполняется
+	(один раз): в плане фактические времена и буферы, строки не возвращаются"""
+	options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+	return json.loads(
+		await conn.fetchval(f"EXPLAIN ({options}) {query}", *args) or "[]"
+	)
+
+
+async def check_cost(
+	conn: asyncpg.Connection, query: str, args: list, max_cost: float
+) -> None:
+	"""Отсекает запрос по оценке планировщика до выполнения; 0 — без проверки.
+
+	Оценка учитывает LIMIT и фильтры, поэтому страницы и узкие запросы
+	проходят, а полный расчет без фильтров на большой базе — нет
+	"""
+	if max_cost:
+		check_plan_cost(await explain(conn, query, args), max_cost)
+
+
+def check_plan_cost(plan: Plan, max_cost: float) -> None:
+	cost = plan[0]["Plan"]["Total Cost"]
+	if max_cost and cost > max_cost:
+		raise QueryCostExceeded(cost, max_cost)
+
+
+class SlowQueryLog:
+	"""Медленные запросы (дольше threshold секунд) пишутся в лог с эндпоинтом
+	и формой запроса. План того же выполнения с фактическими временами и
+	буферами пишет в лог PostgreSQL auto_explain (setup_auto_explain):
+	запрос не повторяется и не планируется заново"""
+
+	def __init__(self, threshold: float) -> None:
+		self._threshold = threshold
+
+	def record(self, seconds: float) -> None:
+		if not self._threshold or seconds < self._threshold:
+			return
+		endpoint, shape = request_labels.get()
+		logger.warning(
+			"Slow distribution query",
+			seconds=round(seconds, 3),
+			endpoint=endpoint,
+			shape=shape,
+		)
+
+
+async def fetch_guarded(
+	conn: asyncpg.Connection,
+	query: str,
+	args: list,
+	slow_log: SlowQueryLog | None = None,
+	max_cost: float = cfg.distribution_max_cost,
+) -> list[asyncpg.Record]:
+	"""fetch с проверкой стоимости, метрикой времени и журналом медленных"""
+	await check_cost(conn, query, args, max_cost)
+	started = time.perf_counter()
+	with observe(QUERY_SECONDS):
+		rows = await conn.fetch(query, *args)
+	if slow_log:
+		slow_log.record(time.perf_counter() - started)
+	return rows
@@ -0,0 +1,105 @@
+import itertools
+import json
+import re
+import time
+from collections.abc import Iterator
+from dataclasses import fields, replace
+from datetime import date as Date
+from typing import get_args
+from uuid import UUID
+
+import asyncpg
+import structlog
+
+from core.workflow.calc import build_batch_query, build_distribution_query
+from core.workflow.dataclasses import Allocation, DataSourceProfile, DistributionParams
+
+logger = structlog.get_logger()
+
+IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+TABLE_FIELDS = tuple(f.name for f in fields(DataSourceProfile) if f.name != "name")
+
+DEFAULT_PROFILE = DataSourceProfile()
+PROFILES: dict[str, DataSourceProfile] = {}
+
+
+def register_profile(profile: DataSourceProfile) -> None:
+	"""Имена схемы и таблиц попадают в SQL как есть, поэтому только идентификаторы"""
+	for name in TABLE_FIELDS:
+		value = getattr(profile, name)
+		if value is not None and not IDENTIFIER.match(value):
+			raise ValueError(
+				f"Profile '{profile.name}': {name}='{value}' is not a valid identifier"
+			)
+	PROFILES[profile.name] = profile
+
+
+def get_profile(name: str) -> DataSourceProfile:
+	return PROFILES[name]
+
+
+def load_profiles(raw: str) -> None:
+	"""Профили из JSON вида {"name": {"schema": ..., "rc_table": ...}}"""
+	register_profile(DEFAULT_PROFILE)
+	for name, tables in (json.loads(raw) if raw else {}).items():
+		register_profile(DataSourceProfile(name=name, **tables))
+
+
+async def validate_profiles(conn: asyncpg.Connection) -> None:
+	"""Проверка, что все таблицы профилей существуют; битые профили только
+	логируются — при первом деплое миграции накатываются после старта API"""
+	for profile in PROFILES.values():
+		tables = [
+			f"{profile.schema}.{getattr(profile, name)}"
+			for name in TABLE_FIELDS
+			if name != "schema" and getattr(profile, name) is not None
+		]
+		rows = await conn.fetch(
+			"SELECT t FROM unnest($1::text[]) AS t WHERE to_regclass(t) IS NULL",
+			tables,
+		)
+		if rows:
+			logger.error(
+				"Data source profile has missing tables",
+				profile=profile.name,
+				missing=[row["t"] for row in rows],
+				stage="lifespan",
+			)
+		else:
+			logger.info("Data source profile validated", profile=profile.name)
+
+
+def iter_warm_queries(profile: DataSourceProfile) -> Iterator[tuple[str, list]]:
+	"""Горячие формы запроса профиля без фильтров выборки: день, страница,
+	диапазон и пакет для каждого режима. Дата Date.min — партиций под нее
+	нет, поэтому выполнение сводится к планированию"""
+	stub = UUID(int=0)
+	for allocation, volume in itertools.product(get_args(Allocation), (False, True)):
+		day = DistributionParams(
+			date=Date.min, allocation=allocation, respect_volume=volume, source=profile
+		)
+		yield build_distribution_query(day)
+		yield build_distribution_query(replace(day, limit=1, after=(stub, stub)))
+		yield build_distribution_query(replace(day, date_to=Date.min))
+		yield build_batch_query(day, [])
+
+
+async def warm_connection(conn: asyncpg.Connection) -> None:
+	"""init-хук пула API, последним после кодеков: формы запроса профиля по
+	умолчанию выполняются один раз и остаются в LRU-кэше statements
+	соединения, первый запрос к /distribution не платит за prepare"""
+	started = time.perf_counter()
+	warmed = 0
+	try:
+		for query, args in iter_warm_queries(DEFAULT_PROFILE):
+			await conn.fetch(query, *args)
+			warmed += 1
+	except (asyncpg.UndefinedTableError, asyncpg.InvalidSchemaNameError):
+		# миграции еще не применены — формы подготовятся при первом запросе
+		pass
+	logger.debug(
+		"Connection warmed",
+		statements=warmed,
+		seconds=round(time.perf_counter() - started, 3),
+		stage="lifespan",
+	)
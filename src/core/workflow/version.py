@@ -0,0 +1,37 @@
+import asyncpg
+
+# Канал NOTIFY, payload — новая версия данных
+DATA_CHANNEL = "logistics_data_changed"
+# Канал NOTIFY об изменении структуры схемы (миграции, партиции), без payload
+SCHEMA_CHANNEL = "logistics_schema_changed"
+
+
+async def get_data_version(conn: asyncpg.Connection) -> int:
+	try:
+		version = await conn.fetchval("SELECT version FROM logistics.data_version")
+	except asyncpg.UndefinedTableError:
+		# миграции еще не применены
+		return 0
+	return version or 0
+
+
+async def bump_data_version(conn: asyncpg.Connection) -> int:
+	"""Инкремент версии + NOTIFY (доставляется слушателям после коммита)"""
+	version = await conn.fetchval(
+		"""
+        WITH bumped AS (
+            UPDATE logistics.data_version
+            SET version = version + 1, updated_at = NOW()
+            RETURNING version
+        )
+        SELECT version, pg_notify($1, version::text) FROM bumped
+        """,
+		DATA_CHANNEL,
+	)
+	# без строки data_version (миграции не применены) обновлять нечего
+	return version or 0
+
+
+async def notify_schema_changed(conn: asyncpg.Connection) -> None:
+	"""Сброс кэша метаданных /manage во всех воркерах (после коммита)"""
+	await conn.execute("SELECT pg_notify($1, '')", SCHEMA_CHANNEL)
@@ -0,0 +1,170 @@
+import datetime
+import time
+from collections.abc import AsyncIterable, Iterable, Sequence
+from dataclasses import dataclass
+from decimal import Decimal
+
+import asyncpg
+import structlog
+
+from core.metrics import ETL_ROWS, ETL_SECONDS
+
+logger = structlog.get_logger()
+
+
+@dataclass(frozen=True, slots=True)
+class MergeTarget:
+	"""Таблица с естественным ключом: новые строки сначала пишутся во
+	временную staging-таблицу и сливаются upsert-ом в одной транзакции —
+	читатели до коммита видят прежние данные, а не пустую таблицу"""
+
+	table: str
+	key: tuple[str, ...]
+	values: tuple[str, ...]
+
+	@property
+	def columns(self) -> tuple[str, ...]:
+		return (*self.key, *self.values)
+
+
+def to_numeric(value: float, places: int = 2) -> Decimal:
+	"""float в numeric asyncpg пишет точным двоичным разложением
+	(26.63 -> 26.6299999...), Decimal из строки — ровно places знаков"""
+	return Decimal(f"{value:.{places}f}")
+
+
+async def copy_records(
+	conn: asyncpg.Connection,
+	table: str,
+	columns: Sequence[str],
+	records: Iterable[tuple] | AsyncIterable[tuple],
+	schema: str = "logistics",
+) -> int:
+	"""Загрузка строк через бинарный COPY, возвращает число записанных строк"""
+	started = time.perf_counter()
+	status = await conn.copy_records_to_table(
+		table, records=records, columns=list(columns), schema_name=schema
+	)
+	elapsed = time.perf_counter() - started
+
+	# copy_records_to_table возвращает статус вида "COPY 12345"
+	return _loaded(schema, table, status, elapsed)
+
+
+async def insert_select(
+	conn: asyncpg.Connection,
+	table: str,
+	query: str,
+	*args: object,
+	schema: str = "logistics",
+) -> int:
+	"""INSERT ... SELECT целиком в базе: строки не ходят через клиента"""
+	started = time.perf_counter()
+	status = await conn.execute(query, *args)
+	# статус вида "INSERT 0 12345"
+	return _loaded(schema, table, status, time.perf_counter() - started)
+
+
+def _loaded(schema: str, table: str, status: str, elapsed: float) -> int:
+	rows = int(status.split()[-1])
+	ETL_ROWS.labels(table).inc(rows)
+	ETL_SECONDS.labels(table).inc(elapsed)
+	logger.info(
+		"Bulk load complete",
+		table=f"{schema}.{table}",
+		rows=rows,
+		seconds=round(elapsed, 3),
+		rows_per_sec=round(rows / elapsed) if elapsed else rows,
+		stage="etl",
+	)
+	return rows
+
+
+async def create_staging(conn: asyncpg.Connection, target: MergeTarget) -> None:
+	"""pg_temp.<table> с колонками цели, без ключей и умолчаний, плюс номер
+	строки staged в порядке записи; живет до конца транзакции, поэтому
+	вызывается только внутри нее"""
+	await conn.execute(
+		f"CREATE TEMP TABLE {target.table} ON COMMIT DROP AS "  # noqa: S608
+		f"SELECT {', '.join(target.columns)} FROM logistics.{target.table} WITH NO DATA"
+	)
+	await conn.execute(
+		f"ALTER TABLE pg_temp.{target.table} "
+		"ADD COLUMN staged bigint GENERATED ALWAYS AS IDENTITY"
+	)
+
+
+async def merge_staging(
+	conn: asyncpg.Connection,
+	target: MergeTarget,
+	dates: list[datetime.date] | None = None,
+) -> int:
+	"""Upsert из staging и удаление ключей, которых в staging нет (в пределах
+	dates, если заданы). Из повторов ключа в staging берется последняя
+	записанная строка; неизмененные строки не переписываются. Возвращает
+	число вставленных, обновленных и удаленных строк"""
+	table = target.table
+	columns = ", ".join(target.columns)
+	key = ", ".join(target.key)
+	current = ", ".join(f"t.{column}" for column in target.values)
+	excluded = ", ".join(f"EXCLUDED.{column}" for column in target.values)
+	matches = " AND ".join(f"s.{column} = t.{column}" for column in target.key)
+	scope = "t.date = ANY($1::date[])" if dates is not None else "TRUE"
+
+	started = time.perf_counter()
+	# у временной таблицы нет статистики, без нее план NOT EXISTS случаен
+	await conn.execute(f"ANALYZE pg_temp.{table}")
+	upserted = await conn.execute(f"""
+		INSERT INTO logistics.{table} AS t ({columns})
+		SELECT DISTINCT ON ({key}) {columns} FROM pg_temp.{table}
+		ORDER BY {key}, staged DESC
+		ON CONFLICT ({key}) DO UPDATE
+		SET ({", ".join(target.values)}) = ROW({excluded})
+		WHERE ROW({current}) IS DISTINCT FROM ROW({excluded})
+	""")  # noqa: S608
+	deleted = await conn.execute(
+		f"""
+		DELETE FROM logistics.{table} t
+		WHERE {scope}
+			AND NOT EXISTS (SELECT FROM pg_temp.{table} s WHERE {matches})
+		""",  # noqa: S608
+		*([dates] if dates is not None else []),
+	)
+
+	changed = int(upserted.split()[-1]), int(deleted.split()[-1])
+	logger.info(
+		"Merge complete",
+		table=f"logistics.{table}",
+		upserted=changed[0],
+		deleted=changed[1],
+		seconds=round(time.perf_counter() - started, 3),
+		stage="etl",
+	)
+	return sum(changed)
+
+
+async def merge_records(
+	conn: asyncpg.Connection,
+	target: MergeTarget,
+	records: Iterable[tuple] | AsyncIterable[tuple],
+	dates: list[datetime.date] | None = None,
+) -> int:
+	"""COPY в staging и слияние; вызывается внутри транзакции"""
+	await create_staging(conn, target)
+	await copy_records(conn, target.table, target.columns, records, schema="pg_temp")
+	return await merge_staging(conn, target, dates)
+
+
+async def merge_select(
+	conn: asyncpg.Connection, target: MergeTarget, query: str, *args: object
+) -> int:
+	"""query — SELECT колонок target.columns; считается в базе прямо в staging"""
+	await create_staging(conn, target)
+	await insert_select(
+		conn,
+		target.table,
+		f"INSERT INTO pg_temp.{target.table} ({', '.join(target.columns)}) {query}",
+		*args,
+		schema="pg_temp",
+	)
+	return await merge_staging(conn, target)
@@ -0,0 +1,39 @@
+from collections.abc import Awaitable, Callable
+
+import asyncpg
+import structlog
+
+from config import cfg
+from core.workflow.version import bump_data_version
+from etl.bulk import MergeTarget, merge_records, merge_select
+from etl.watermark import is_current, set_watermark, upstream_checksum
+
+logger = structlog.get_logger()
+
+Records = Callable[[asyncpg.Connection], Awaitable[list[tuple]]]
+
+
+async def merge_generated(
+	conn: asyncpg.Connection,
+	target: MergeTarget,
+	query: str,
+	records: Records,
+	*upstream: str,
+) -> None:
+	"""Производная таблица пересчитывается, только если изменились входные
+	таблицы upstream: запросом query в базе ($1 — сид) или через Python
+	(records), и сливается upsert-ом вместо перезаливки"""
+	checksum = await upstream_checksum(conn, *upstream)
+	if await is_current(conn, target.table, checksum):
+		return
+
+	logger.info(f"Populating {target.table}...", server_side=cfg.etl_server_generation)
+	async with conn.transaction():
+		if cfg.etl_server_generation:
+			changed = await merge_select(conn, target, query, cfg.etl_seed)
+		else:
+			changed = await merge_records(conn, target, await records(conn))
+		await set_watermark(conn, target.table, checksum)
+		if changed:
+			await bump_data_version(conn)
+	logger.info(f"Merged {target.table}", changed=changed)
@@ -1,53 +1,55 @@
 import asyncio
-import random
 
 import asyncpg
-import structlog
 
 from config import cfg
 from core.factories.db import create_pool
+from etl.bulk import MergeTarget
+from etl.derived import merge_generated
+from etl.seed import etl_rng, sql_uniform
 from logger import setup_logger
 
 setup_logger()
-logger = structlog.get_logger()
 
-BATCH_SIZE = 5000
-
-
-async def insert_in_batches(
-	conn: asyncpg.Connection, query: str, rows: list[tuple]
-) -> None:
-	for i in range(0, len(rows), BATCH_SIZE):
-		batch = rows[i : i + BATCH_SIZE]
-		await conn.executemany(query, batch)
-		logger.info("Inserted logdays batch", start=i, size=len(batch))
+LOGDAYS = MergeTarget("logdays", ("branch_id", "category_id"), ("logdays",))
+
+# $1 — сид; логистическое плечо равновероятно 7, 14 или 21 день
+GENERATE_LOGDAYS = f"""
+	SELECT
+		branch_id,
+		category_id,
+		(ARRAY[7, 14, 21])[
+			1 + floor(3 * {sql_uniform("logdays", "branch_id", "category_id")})::int
+		]
+	FROM (
+		SELECT DISTINCT b.branch_id, p.category_id
+		FROM logistics.branch_product_history b
+		JOIN logistics.products p ON b.product_id = p.product_id
+	) pairs
+"""  # noqa: S608
 
 
 async def generate_logdays(conn: asyncpg.Connection) -> None:
-	logger.info("Generating logdays...")
+	await merge_generated(
+		conn,
+		LOGDAYS,
+		GENERATE_LOGDAYS,
+		logdays_records,
+		"branch_product_history",
+		"products",
+	)
+
 
+async def logdays_records(conn: asyncpg.Connection) -> list[tuple]:
+	rng = etl_rng("logdays")
 	rows = await conn.fetch("""
 		SELECT DISTINCT b.branch_id, p.category_id
 		FROM logistics.branch_product_history b
 		JOIN logistics.products p ON b.product_id = p.product_id
+		ORDER BY b.branch_id, p.category_id
 	""")
 
-	values = [
-		(r["branch_id"], r["category_id"], random.choice([7, 14, 21]))  # noqa: S311
-		for r in rows
-	]
-
-	await conn.execute("TRUNCATE logistics.logdays RESTART IDENTITY CASCADE")
-	await insert_in_batches(
-		conn,
-		"""
-		INSERT INTO logistics.logdays (branch_id, category_id, logdays)
-		VALUES ($1, $2, $3)
-		""",
-		values,
-	)
-
-	logger.info("Inserted all logdays", total=len(values))
+	return [(r["branch_id"], r["category_id"], rng.choice([7, 14, 21])) for r in rows]
 
 
 async def main() -> None:
@@ -1,36 +1,49 @@
 import asyncio
 from collections import defaultdict
-from random import uniform
 from statistics import median
 
 import asyncpg
-import structlog
 
 from config import cfg
 from core.factories.db import create_pool
+from etl.bulk import MergeTarget, to_numeric
+from etl.derived import merge_generated
+from etl.seed import etl_rng, sql_uniform
 from logger import setup_logger
 
 setup_logger()
-logger = structlog.get_logger()
 
-BATCH_SIZE = 5000
+NEEDS = MergeTarget("needs", ("branch_id", "product_id"), ("needs",))
 
-
-async def insert_in_batches(
-	conn: asyncpg.Connection, query: str, rows: list[tuple]
-) -> None:
-	for i in range(0, len(rows), BATCH_SIZE):
-		batch = rows[i : i + BATCH_SIZE]
-		await conn.executemany(query, batch)
-		logger.info("Inserted batch", start=i, size=len(batch))
+# медиана остатка пары за историю (как statistics.median), $1 — сид
+GENERATE_NEEDS = f"""
+	SELECT
+		branch_id,
+		product_id,
+		round((
+			percentile_cont(0.5) WITHIN GROUP (ORDER BY stock)
+			* (1.2 + 0.8 * {sql_uniform("needs", "branch_id", "product_id")})
+		)::numeric, 2)
+	FROM logistics.branch_product_history
+	GROUP BY branch_id, product_id
+"""  # noqa: S608
 
 
 async def generate_needs(conn: asyncpg.Connection) -> None:
-	logger.info("Generating needs...")
+	await merge_generated(
+		conn, NEEDS, GENERATE_NEEDS, needs_records, "branch_product_history"
+	)
+
+
+async def needs_records(conn: asyncpg.Connection) -> list[tuple]:
+	"""Запасной путь: вся история едет в клиент и обратно"""
+	rng = etl_rng("needs")
 
+	# порядок строк фиксирован, чтобы сид давал те же значения тем же парам
 	rows = await conn.fetch("""
 		SELECT branch_id, product_id, stock
 		FROM logistics.branch_product_history
+		ORDER BY branch_id, product_id, date
 	""")
 
 	grouped: dict[tuple[str, str], list[float]] = defaultdict(list)
@@ -38,30 +51,17 @@ async def generate_needs(conn: asyncpg.Connection) -> None:
 		key = (row["branch_id"], row["product_id"])
 		grouped[key].append(float(row["stock"]))
 
-	values = [
+	return [
 		(
 			branch_id,
 			product_id,
-			round(
-				median(stocks) * uniform(1.2, 2.0),  # noqa: S311
-				2,
+			to_numeric(
+				median(stocks) * rng.uniform(1.2, 2.0)
 			),  # специально увеличиваем потребность, иначе все отфильтруется
 		)
 		for (branch_id, product_id), stocks in grouped.items()
 	]
 
-	await conn.execute("TRUNCATE logistics.needs RESTART IDENTITY CASCADE")
-	await insert_in_batches(
-		conn,
-		"""
-		INSERT INTO logistics.needs (branch_id, product_id, needs)
-		VALUES ($1, $2, $3)
-		""",
-		values,
-	)
-
-	logger.info("Inserted needs", total=len(values))
-
 
 async def main() -> None:
 	pool = await create_pool(cfg.pg_url)
@@ -1,78 +1,80 @@
 import asyncio
-import random
 
 import asyncpg
-import structlog
 
 from config import cfg
 from core.factories.db import create_pool
+from etl.bulk import MergeTarget, to_numeric
+from etl.derived import merge_generated
+from etl.seed import etl_rng, sql_uniform
 from logger import setup_logger
 
 setup_logger()
-logger = structlog.get_logger()
 
-BATCH_SIZE = 5000
+MIN_SHIPMENT = MergeTarget("min_shipment", ("branch_id", "product_id"), ("min_qty",))
+STORAGE_LIMITS = MergeTarget("storage_limits", ("branch_id",), ("max_volume",))
 
+# $1 — сид; min_qty специально занижен, иначе строки отфильтруются
+GENERATE_MIN_SHIPMENT = f"""
+	SELECT
+		branch_id,
+		product_id,
+		round((0.01 + 0.04 * {sql_uniform("min_shipment", "branch_id", "product_id")})::numeric, 2)
+	FROM logistics.needs
+"""  # noqa: S608
 
-async def insert_in_batches(
-	conn: asyncpg.Connection, query: str, rows: list[tuple]
-) -> None:
-	for i in range(0, len(rows), BATCH_SIZE):
-		await conn.executemany(query, rows[i : i + BATCH_SIZE])
-		logger.info("Batch inserted", size=len(rows[i : i + BATCH_SIZE]))
+# $1 — сид; целый лимит 300..1000 включительно
+GENERATE_STORAGE_LIMITS = f"""
+	SELECT branch_id, 300 + floor(701 * {sql_uniform("storage_limits", "branch_id")})
+	FROM (SELECT DISTINCT branch_id FROM logistics.branch_product_history) branches
+"""  # noqa: S608
 
 
 async def populate_min_shipment(conn: asyncpg.Connection) -> None:
-	logger.info("Populating min_shipment...")
+	await merge_generated(
+		conn, MIN_SHIPMENT, GENERATE_MIN_SHIPMENT, min_shipment_records, "needs"
+	)
+
+
+async def min_shipment_records(conn: asyncpg.Connection) -> list[tuple]:
+	rng = etl_rng("min_shipment")
 	rows = await conn.fetch("""
 		SELECT branch_id, product_id
 		FROM logistics.needs
+		ORDER BY branch_id, product_id
 	""")
 
-	values = [
+	return [
 		(
 			r["branch_id"],
 			r["product_id"],
-			round(
-				random.uniform(0.01, 0.05),  # noqa: S311
-				2,
+			to_numeric(
+				rng.uniform(0.01, 0.05)
 			),  # <-- специально занижаем qty, иначе отфильтруется
 		)
 		for r in rows
 	]
 
-	await conn.execute("TRUNCATE logistics.min_shipment RESTART IDENTITY CASCADE")
-	await insert_in_batches(
+
+async def populate_storage_limits(conn: asyncpg.Connection) -> None:
+	await merge_generated(
 		conn,
-		"""
-		INSERT INTO logistics.min_shipment (branch_id, product_id, min_qty)
-		VALUES ($1, $2, $3)
-		""",
-		values,
+		STORAGE_LIMITS,
+		GENERATE_STORAGE_LIMITS,
+		storage_limits_records,
+		"branch_product_history",
 	)
 
 
-async def populate_storage_limits(conn: asyncpg.Connection) -> None:
-	logger.info("Populating storage_limits...")
+async def storage_limits_records(conn: asyncpg.Connection) -> list[tuple]:
+	rng = etl_rng("storage_limits")
 	rows = await conn.fetch("""
 		SELECT DISTINCT branch_id
 		FROM logistics.branch_product_history
+		ORDER BY branch_id
 	""")
 
-	values = [
-		(r["branch_id"], random.randint(300, 1000))  # noqa: S311
-		for r in rows
-	]
-
-	await conn.execute("TRUNCATE logistics.storage_limits RESTART IDENTITY CASCADE")
-	await insert_in_batches(
-		conn,
-		"""
-		INSERT INTO logistics.storage_limits (branch_id, max_volume)
-		VALUES ($1, $2)
-		""",
-		values,
-	)
+	return [(r["branch_id"], rng.randint(300, 1000)) for r in rows]
 
 
 async def main() -> None:
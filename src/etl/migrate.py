@@ -1,36 +1,94 @@
+import asyncpg
 import structlog
 
 from config import cfg
 from core.factories.db import acquire_connection, create_pool
-from migrations.queries import MIGRATIONS
+from core.workflow.version import bump_data_version, notify_schema_changed
+from migrations.queries import MIGRATIONS, Migration
 
 logger = structlog.get_logger()
 
+# Ключ session-level advisory lock: параллельные запуски migrate ждут друг друга
+MIGRATION_LOCK_ID = 7_340_001
+
+
+async def drop_invalid_indexes(conn: asyncpg.Connection) -> None:
+	"""Прерванный CREATE INDEX CONCURRENTLY оставляет INVALID индекс,
+	который IF NOT EXISTS потом молча пропустит."""
+	rows = await conn.fetch("""
+        SELECT n.nspname AS schema_name, c.relname AS index_name
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid AND n.nspname = 'logistics'
+    """)
+	for row in rows:
+		logger.warning(
+			"Dropping invalid index", index=row["index_name"], stage="migrate"
+		)
+		await conn.execute(
+			f'DROP INDEX CONCURRENTLY IF EXISTS "{row["schema_name"]}"."{row["index_name"]}"'
+		)
+
+
+async def apply_migration(
+	conn: asyncpg.Connection, name: str, migration: Migration
+) -> None:
+	if migration.transactional:
+		async with conn.transaction():
+			await conn.execute(migration.sql)
+			await conn.execute(
+				"INSERT INTO public.migration_log (migration_name) VALUES ($1)", name
+			)
+		return
+
+	await drop_invalid_indexes(conn)
+	await conn.execute(migration.sql)
+	await conn.execute(
+		"INSERT INTO public.migration_log (migration_name) VALUES ($1)", name
+	)
+
 
 async def migrate() -> None:
 	pool = await create_pool(cfg.pg_url)
 
 	async with acquire_connection(pool) as conn:
-		# Обеспечим таблицу логов
-		await conn.execute("""
-            CREATE TABLE IF NOT EXISTS public.migration_log (
-                id SERIAL PRIMARY KEY,
-                migration_name TEXT NOT NULL UNIQUE,
-                applied_at TIMESTAMPTZ DEFAULT NOW()
-            );
-        """)
-
-		# Получим список уже применённых
-		applied = await conn.fetch("SELECT migration_name FROM public.migration_log")
-		applied_names = {row["migration_name"] for row in applied}
-
-		for name, sql in MIGRATIONS.items():
-			if name in applied_names:
-				continue
-
-			logger.info(f"Applying migration: {name}", stage="migrate")
-			await conn.execute(sql)
-			await conn.execute(
-				"INSERT INTO public.migration_log (migration_name) VALUES ($1)", name
+		logger.info("Waiting for migration lock", stage="migrate")
+		await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+		try:
+			# Обеспечим таблицу логов
+			await conn.execute("""
+                CREATE TABLE IF NOT EXISTS public.migration_log (
+                    id SERIAL PRIMARY KEY,
+                    migration_name TEXT NOT NULL UNIQUE,
+                    applied_at TIMESTAMPTZ DEFAULT NOW()
+                );
+            """)
+
+			# Получим список уже применённых
+			applied = await conn.fetch(
+				"SELECT migration_name FROM public.migration_log"
 			)
-		logger.info("All migrations applied.", stage="migrate")
+			applied_names = {row["migration_name"] for row in applied}
+
+			pending = [
+				(name, migration)
+				for name, migration in MIGRATIONS.items()
+				if name not in applied_names
+			]
+			for name, migration in pending:
+				logger.info(
+					f"Applying migration: {name}",
+					stage="migrate",
+					transactional=migration.transactional,
+				)
+				await apply_migration(conn, name, migration)
+			if pending:
+				# схема поменялась — закэшированные результаты и метаданные невалидны
+				await bump_data_version(conn)
+				await notify_schema_changed(conn)
+			logger.info("All migrations applied.", stage="migrate")
+		finally:
+			await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+	await pool.close()
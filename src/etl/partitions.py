@@ -0,0 +1,121 @@
+import asyncio
+import datetime
+
+import asyncpg
+import structlog
+
+from config import cfg
+from core.factories.db import acquire_connection, create_pool
+from core.workflow.version import bump_data_version, notify_schema_changed
+from logger import setup_logger
+
+setup_logger()
+logger = structlog.get_logger()
+
+HISTORY_TABLES = ("branch_product_history", "rc_product_history")
+AGGREGATE_TABLES = ("rc_available_daily", "branch_volume_daily")
+
+# Партиции именуются <table>_pYYYYMMDD (см. ensure_history_partitions)
+LIST_PARTITIONS = """
+    SELECT
+        c.relname AS partition_name,
+        to_date(right(c.relname, 8), 'YYYYMMDD') AS day,
+        i.inhdetachpending AS detach_pending
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = $1::regclass
+    ORDER BY day
+"""
+
+
+def partition_name(table: str, day: datetime.date) -> str:
+	return f"{table}_p{day:%Y%m%d}"
+
+
+async def ensure_partitions(
+	conn: asyncpg.Connection, date_from: datetime.date, date_to: datetime.date
+) -> int:
+	"""Создает недостающие дневные партиции истории за [date_from, date_to]"""
+	created = await conn.fetchval(
+		"SELECT logistics.ensure_history_partitions($1, $2)", date_from, date_to
+	)
+	if created:
+		# новые партиции видны в /manage/tables
+		await notify_schema_changed(conn)
+		logger.info(
+			"History partitions created",
+			created=created,
+			date_from=str(date_from),
+			date_to=str(date_to),
+			stage="etl",
+		)
+	return created or 0
+
+
+async def drop_expired_partitions(
+	conn: asyncpg.Connection, table: str, cutoff: datetime.date
+) -> list[str]:
+	"""DETACH CONCURRENTLY не блокирует чтение и запись в родителя; прерванный
+	detach оставляет партицию в состоянии pending — такие дожимаются FINALIZE"""
+	dropped = []
+	for row in await conn.fetch(LIST_PARTITIONS, f"logistics.{table}"):
+		if row["day"] >= cutoff:
+			break
+		name = row["partition_name"]
+		mode = "FINALIZE" if row["detach_pending"] else "CONCURRENTLY"
+		await conn.execute(
+			f'ALTER TABLE logistics."{table}" DETACH PARTITION logistics."{name}" {mode}'
+		)
+		await conn.execute(f'DROP TABLE logistics."{name}"')
+		dropped.append(name)
+	return dropped
+
+
+async def apply_retention(conn: asyncpg.Connection, retention_days: int) -> int:
+	"""Удаляет историю и дневные агрегаты старше retention_days дней"""
+	cutoff = datetime.date.today() - datetime.timedelta(days=retention_days)
+	dropped = [
+		name
+		for table in HISTORY_TABLES
+		for name in await drop_expired_partitions(conn, table, cutoff)
+	]
+	async with conn.transaction():
+		for table in AGGREGATE_TABLES:
+			await conn.execute(
+				f"DELETE FROM logistics.{table} WHERE date < $1",  # noqa: S608
+				cutoff,
+			)
+		if dropped:
+			await bump_data_version(conn)
+			await notify_schema_changed(conn)
+
+	logger.info(
+		"History retention applied",
+		cutoff=str(cutoff),
+		dropped=dropped,
+		stage="etl",
+	)
+	return len(dropped)
+
+
+async def maintain_partitions(pool: asyncpg.Pool) -> None:
+	"""Партиции на history_partitions_ahead дней вперед и retention, если задан"""
+	today = datetime.date.today()
+	async with acquire_connection(pool) as conn:
+		await ensure_partitions(
+			conn, today, today + datetime.timedelta(days=cfg.history_partitions_ahead)
+		)
+		if cfg.history_retention_days:
+			await apply_retention(conn, cfg.history_retention_days)
+
+
+async def main() -> None:
+	pool = await create_pool(cfg.pg_url)
+	try:
+		await maintain_partitions(pool)
+	finally:
+		await pool.close()
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
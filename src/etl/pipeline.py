@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+
+import asyncpg
+import structlog
+
+from config import cfg
+from core.factories.db import acquire_connection, create_pool
+from etl.generate_logdays import generate_logdays
+from etl.generate_needs import generate_needs
+from etl.generate_shipment_and_limits import (
+	populate_min_shipment,
+	populate_storage_limits,
+)
+from etl.partitions import maintain_partitions
+from etl.populate_history import populate_history
+from etl.populate_products import populate_products
+from etl.populate_products_vol import populate_products_vol
+from etl.refresh_aggregates import refresh_changed_aggregates
+from etl.watermark import reset_watermarks
+
+logger = structlog.get_logger()
+
+
+@dataclass(frozen=True, slots=True)
+class Step:
+	name: str
+	run: Callable[[asyncpg.Pool], Awaitable[None]]
+	depends_on: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class StepTiming:
+	name: str
+	started: float
+	finished: float
+
+	@property
+	def duration(self) -> float:
+		return self.finished - self.started
+
+
+def with_connection(
+	func: Callable[[asyncpg.Connection], Awaitable[None]],
+) -> Callable[[asyncpg.Pool], Awaitable[None]]:
+	async def run(pool: asyncpg.Pool) -> None:
+		async with acquire_connection(pool) as conn:
+			await func(conn)
+
+	return run
+
+
+ETL_STEPS = (
+	Step("partitions", maintain_partitions),
+	Step("history", populate_history, depends_on=("partitions",)),
+	Step("products", populate_products),
+	Step("products_vol", populate_products_vol),
+	Step("needs", with_connection(generate_needs), depends_on=("history",)),
+	Step(
+		"logdays",
+		with_connection(generate_logdays),
+		depends_on=("history", "products"),
+	),
+	Step(
+		"min_shipment",
+		with_connection(populate_min_shipment),
+		depends_on=("needs",),
+	),
+	Step(
+		"storage_limits",
+		with_connection(populate_storage_limits),
+		depends_on=("history",),
+	),
+	Step(
+		"aggregates",
+		with_connection(refresh_changed_aggregates),
+		depends_on=("history", "products_vol"),
+	),
+)
+
+
+def topological_order(steps: Iterable[Step]) -> list[Step]:
+	by_name = {step.name: step for step in steps}
+	order: list[Step] = []
+	state: dict[str, bool] = {}  # False — в обработке, True — готово
+
+	def visit(name: str) -> None:
+		if state.get(name):
+			return
+		if name in state:
+			raise ValueError(f"ETL steps have a dependency cycle through '{name}'")
+		if name not in by_name:
+			raise ValueError(f"Unknown ETL step: '{name}'")
+		state[name] = False
+		for dep in by_name[name].depends_on:
+			visit(dep)
+		state[name] = True
+		order.append(by_name[name])
+
+	for name in by_name:
+		visit(name)
+	return order
+
+
+def critical_path(
+	steps: Iterable[Step], timings: dict[str, StepTiming]
+) -> tuple[list[str], float]:
+	"""Самая длинная по суммарному времени цепочка зависимых шагов"""
+	cost: dict[str, float] = {}
+	prev: dict[str, str | None] = {}
+	for step in topological_order(steps):
+		slowest = max(step.depends_on, key=lambda dep: cost[dep], default=None)
+		prev[step.name] = slowest
+		cost[step.name] = timings[step.name].duration + (
+			cost[slowest] if slowest else 0.0
+		)
+
+	last = max(cost, key=lambda name: cost[name])
+	path: list[str] = []
+	node: str | None = last
+	while node:
+		path.append(node)
+		node = prev[node]
+	return path[::-1], cost[last]
+
+
+async def run_pipeline(
+	pool: asyncpg.Pool, steps: Iterable[Step] = ETL_STEPS
+) -> dict[str, StepTiming]:
+	"""Запуск шагов как DAG: независимые шаги идут конкурентно на общем пуле"""
+	ordered = topological_order(steps)
+	timings: dict[str, StepTiming] = {}
+	tasks: dict[str, asyncio.Task[None]] = {}
+	origin = time.perf_counter()
+
+	async def run_step(step: Step) -> None:
+		await asyncio.gather(*(tasks[dep] for dep in step.depends_on))
+		logger.info("ETL step started", step=step.name, stage="etl")
+		started = time.perf_counter() - origin
+		await step.run(pool)
+		timings[step.name] = StepTiming(
+			step.name, started, time.perf_counter() - origin
+		)
+		logger.info(
+			"ETL step finished",
+			step=step.name,
+			seconds=round(timings[step.name].duration, 3),
+			stage="etl",
+		)
+
+	# TaskGroup отменит остальные шаги при первой ошибке
+	async with asyncio.TaskGroup() as group:
+		for step in ordered:
+			tasks[step.name] = group.create_task(run_step(step))
+
+	path, path_seconds = critical_path(ordered, timings)
+	logger.info(
+		"ETL pipeline complete",
+		seconds=round(time.perf_counter() - origin, 3),
+		critical_path=path,
+		critical_path_seconds=round(path_seconds, 3),
+		steps={name: round(t.duration, 3) for name, t in timings.items()},
+		stage="etl",
+	)
+	return timings
+
+
+async def main(full: bool = False) -> None:
+	pool = await create_pool(cfg.pg_url)
+	try:
+		if full:
+			async with acquire_connection(pool) as conn:
+				await reset_watermarks(conn)
+		await run_pipeline(pool)
+	finally:
+		await pool.close()
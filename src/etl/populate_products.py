@@ -7,6 +7,9 @@ import structlog
 
 from config import cfg
 from core.factories.db import create_pool
+from core.workflow.version import bump_data_version
+from etl.bulk import MergeTarget, merge_records
+from etl.watermark import file_checksum, is_current, set_watermark
 from logger import setup_logger
 
 setup_logger()
@@ -14,33 +17,26 @@ logger = structlog.get_logger()
 
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
 PRODUCTS_CSV = DATA_DIR / "products.csv"
-BATCH_SIZE = 5000
-
-
-async def insert_in_batches(
-	conn: asyncpg.Connection, query: str, rows: list[tuple]
-) -> None:
-	for i in range(0, len(rows), BATCH_SIZE):
-		batch = rows[i : i + BATCH_SIZE]
-		await conn.executemany(query, batch)
-		logger.info("Inserted batch", start=i, size=len(batch))
+PRODUCTS = MergeTarget("products", ("product_id",), ("category_id",))
 
 
 async def populate_products(pool: asyncpg.Pool) -> None:
-	rows = []
-	with PRODUCTS_CSV.open(encoding="cp1251") as f:
-		reader = csv.DictReader(f)
-		for row in reader:
-			rows.append((row["Product_ID"], row["Category_ID"]))
-
+	checksum = file_checksum(PRODUCTS_CSV)
 	async with pool.acquire() as conn:
-		await conn.execute("TRUNCATE logistics.products RESTART IDENTITY CASCADE")
-		query = """
-			INSERT INTO logistics.products (product_id, category_id)
-			VALUES ($1, $2)
-		"""
-		await insert_in_batches(conn, query, rows)
-		logger.info("All products inserted", total=len(rows))
+		if await is_current(conn, PRODUCTS.table, checksum):
+			return
+
+		with PRODUCTS_CSV.open(encoding="cp1251") as f:
+			rows = [
+				(row["Product_ID"], row["Category_ID"]) for row in csv.DictReader(f)
+			]
+
+		async with conn.transaction():
+			changed = await merge_records(conn, PRODUCTS, rows)
+			await set_watermark(conn, PRODUCTS.table, checksum)
+			if changed:
+				await bump_data_version(conn)
+		logger.info("All products merged", total=len(rows), changed=changed)
 
 
 async def main() -> None:
@@ -1,5 +1,6 @@
 import asyncio
 import csv
+from decimal import Decimal
 from pathlib import Path
 
 import asyncpg
@@ -7,6 +8,10 @@ import structlog
 
 from config import cfg
 from core.factories.db import create_pool
+from core.workflow.version import bump_data_version
+from etl.bulk import MergeTarget, merge_records
+from etl.refresh_aggregates import refresh_changed_aggregates
+from etl.watermark import file_checksum, is_current, set_watermark
 from logger import setup_logger
 
 setup_logger()
@@ -14,38 +19,34 @@ logger = structlog.get_logger()
 
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
 PRODUCTS_VOL_CSV = DATA_DIR / "products_vol.csv"
-BATCH_SIZE = 5000
-
-
-async def insert_in_batches(
-	conn: asyncpg.Connection, query: str, rows: list[tuple]
-) -> None:
-	for i in range(0, len(rows), BATCH_SIZE):
-		batch = rows[i : i + BATCH_SIZE]
-		await conn.executemany(query, batch)
-		logger.info("Inserted batch", start=i, size=len(batch))
+PRODUCTS_VOL = MergeTarget("products_vol", ("product_id",), ("volume_per_unit",))
 
 
 async def populate_products_vol(pool: asyncpg.Pool) -> None:
-	rows = []
-	with PRODUCTS_VOL_CSV.open(encoding="cp1251") as f:
-		reader = csv.DictReader(f)
-		for row in reader:
-			rows.append((row["Товар"], float(row["ОбъемЕд"])))
-
+	checksum = file_checksum(PRODUCTS_VOL_CSV)
 	async with pool.acquire() as conn:
-		await conn.execute("TRUNCATE logistics.products_vol RESTART IDENTITY CASCADE")
-		query = """
-			INSERT INTO logistics.products_vol (product_id, volume_per_unit)
-			VALUES ($1, $2)
-		"""
-		await insert_in_batches(conn, query, rows)
-		logger.info("All product volumes inserted", total=len(rows))
+		if await is_current(conn, PRODUCTS_VOL.table, checksum):
+			return
+
+		with PRODUCTS_VOL_CSV.open(encoding="cp1251") as f:
+			rows = [
+				(row["Товар"], Decimal(row["ОбъемЕд"])) for row in csv.DictReader(f)
+			]
+
+		async with conn.transaction():
+			changed = await merge_records(conn, PRODUCTS_VOL, rows)
+			await set_watermark(conn, PRODUCTS_VOL.table, checksum)
+			if changed:
+				await bump_data_version(conn)
+		logger.info("All product volumes merged", total=len(rows), changed=changed)
 
 
 async def main() -> None:
 	pool = await create_pool(cfg.pg_url)
 	await populate_products_vol(pool)
+	# занятый объем филиалов (branch_volume_daily) зависит от объемов товаров
+	async with pool.acquire() as conn:
+		await refresh_changed_aggregates(conn)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import asyncio
+import datetime
+
+import asyncpg
+import structlog
+
+from config import cfg
+from core.factories.db import create_pool
+from core.workflow.version import bump_data_version
+from etl.watermark import get_watermark, set_watermark, upstream_checksum
+from logger import setup_logger
+
+setup_logger()
+logger = structlog.get_logger()
+
+HISTORY_TABLES = ("branch_product_history", "rc_product_history")
+AGGREGATES_WATERMARK = "daily_aggregates"
+
+# $1 — массив дат; NULL пересчитывает всё
+REFRESH_RC_AVAILABLE = """
+	INSERT INTO logistics.rc_available_daily (date, product_id, available)
+	SELECT date, product_id, SUM(stock - reserved - in_transit)
+	FROM logistics.rc_product_history
+	WHERE $1::date[] IS NULL OR date = ANY($1::date[])
+	GROUP BY date, product_id
+"""
+
+REFRESH_BRANCH_VOLUME = """
+	INSERT INTO logistics.branch_volume_daily (date, branch_id, occupied_volume)
+	SELECT h.date, h.branch_id, COALESCE(SUM(h.stock * pv.volume_per_unit), 0)
+	FROM logistics.branch_product_history h
+	LEFT JOIN logistics.products_vol pv ON pv.product_id = h.product_id
+	WHERE $1::date[] IS NULL OR h.date = ANY($1::date[])
+	GROUP BY h.date, h.branch_id
+"""
+
+
+async def refresh_daily_aggregates(
+	conn: asyncpg.Connection, dates: list[datetime.date] | None = None
+) -> None:
+	"""Пересчет rc_available_daily и branch_volume_daily за даты (или целиком)"""
+	logger.info("Refreshing daily aggregates...", dates=len(dates) if dates else "all")
+
+	async with conn.transaction():
+		for table in ("rc_available_daily", "branch_volume_daily"):
+			await conn.execute(
+				f"DELETE FROM logistics.{table} "  # noqa: S608
+				"WHERE $1::date[] IS NULL OR date = ANY($1::date[])",
+				dates,
+			)
+		rc_status = await conn.execute(REFRESH_RC_AVAILABLE, dates)
+		branch_status = await conn.execute(REFRESH_BRANCH_VOLUME, dates)
+		await bump_data_version(conn)
+
+	logger.info(
+		"Daily aggregates refreshed",
+		rc_rows=int(rc_status.split()[-1]),
+		branch_rows=int(branch_status.split()[-1]),
+	)
+
+
+async def refresh_changed_aggregates(conn: asyncpg.Connection) -> None:
+	"""Шаг ETL: после дозагрузки новых дней истории пересчитываются только
+	они; изменились файлы истории или объемы товаров — все агрегаты"""
+	checksum = await upstream_checksum(
+		conn, *HISTORY_TABLES, "products_vol", with_dates=False
+	)
+	through = await conn.fetchval(
+		"""
+		SELECT min(loaded_through) FROM logistics.etl_watermark
+		WHERE table_name = ANY($1::text[])
+		""",
+		list(HISTORY_TABLES),
+	)
+	watermark = await get_watermark(conn, AGGREGATES_WATERMARK)
+
+	dates = None
+	if watermark and watermark.checksum == checksum:
+		if watermark.loaded_through == through:
+			logger.info("Daily aggregates are up to date", stage="etl")
+			return
+		previous = watermark.loaded_through
+		if previous and through and through > previous:
+			dates = [
+				previous + datetime.timedelta(days=offset)
+				for offset in range(1, (through - previous).days + 1)
+			]
+
+	async with conn.transaction():
+		await refresh_daily_aggregates(conn, dates)
+		await set_watermark(conn, AGGREGATES_WATERMARK, checksum, through)
+
+
+async def main() -> None:
+	pool = await create_pool(cfg.pg_url)
+	async with pool.acquire() as conn:
+		await refresh_daily_aggregates(conn)
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
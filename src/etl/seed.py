@@ -0,0 +1,18 @@
+import random
+
+from config import cfg
+
+
+def etl_rng(name: str, seed: int | None = cfg.etl_seed) -> random.Random:
+	"""Свой поток случайных чисел на генератор: при заданном ETL_SEED результат
+	шага не зависит от того, какие шаги и в каком порядке шли до него"""
+	return random.Random(f"{seed}:{name}") if seed is not None else random.Random()  # noqa: S311
+
+
+def sql_uniform(step: str, *keys: str) -> str:
+	"""SQL-выражение U[0, 1) для строки. При сиде ($1) — хэш от (шаг, ключ)
+	с сидом: в отличие от setseed() + random() не зависит от порядка строк и
+	параллельных воркеров. Без сида ($1 IS NULL) — обычный random()"""
+	key = " || ':' || ".join(f"{column}::text" for column in keys)
+	hashed = f"hashtextextended('{step}:' || {key}, $1::bigint)"
+	return f"COALESCE(({hashed} & 4294967295) / 4294967296.0, random())"
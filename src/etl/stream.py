@@ -0,0 +1,61 @@
+import asyncio
+import csv
+import itertools
+from collections.abc import AsyncIterator, Iterable, Iterator
+from pathlib import Path
+
+import structlog
+
+logger = structlog.get_logger()
+
+CHUNK_SIZE = 5000
+# Сколько готовых чанков может ждать записи в БД: ограничивает память
+# и тормозит парсинг, если COPY не успевает
+QUEUE_CHUNKS = 4
+
+
+def iter_csv(
+	path: Path, encoding: str = "cp1251", limit: int | None = None
+) -> Iterator[dict[str, str]]:
+	"""Построчное чтение CSV, файл целиком в память не попадает"""
+	with path.open(encoding=encoding, newline="") as f:
+		yield from itertools.islice(csv.DictReader(f), limit)
+
+
+def _take(rows: Iterator[tuple], size: int) -> list[tuple]:
+	return list(itertools.islice(rows, size))
+
+
+async def stream_records(
+	rows: Iterable[tuple],
+	chunk_size: int = CHUNK_SIZE,
+	max_chunks: int = QUEUE_CHUNKS,
+) -> AsyncIterator[tuple]:
+	"""Парсинг в отдельном потоке -> ограниченная очередь -> асинхронный итератор.
+
+	Годится как records для copy_records_to_table: чтение и разбор файла
+	идут параллельно с записью в БД.
+	"""
+	source = iter(rows)
+	queue: asyncio.Queue[list[tuple] | BaseException | None] = asyncio.Queue(
+		maxsize=max_chunks
+	)
+
+	async def produce() -> None:
+		try:
+			while chunk := await asyncio.to_thread(_take, source, chunk_size):
+				await queue.put(chunk)
+		except Exception as exc:
+			await queue.put(exc)
+			return
+		await queue.put(None)
+
+	producer = asyncio.create_task(produce())
+	try:
+		while (chunk := await queue.get()) is not None:
+			if isinstance(chunk, BaseException):
+				raise chunk
+			for record in chunk:
+				yield record
+	finally:
+		producer.cancel()
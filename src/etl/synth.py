@@ -0,0 +1,243 @@
+import datetime
+import random
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from decimal import Decimal
+from uuid import UUID
+
+import asyncpg
+import structlog
+
+from etl.bulk import copy_records, to_numeric
+from etl.partitions import ensure_partitions
+from etl.populate_history import BRANCH_COLUMNS, RC_COLUMNS
+from etl.refresh_aggregates import refresh_daily_aggregates
+from etl.stream import stream_records
+
+logger = structlog.get_logger()
+
+SYNTH_TABLES = (
+	"products",
+	"products_vol",
+	"branch_product_history",
+	"rc_product_history",
+	"needs",
+	"min_shipment",
+	"logdays",
+	"storage_limits",
+	"rc_available_daily",
+	"branch_volume_daily",
+	# следующий etl run загрузит все заново поверх синтетики
+	"etl_watermark",
+)
+# средний спрос на пару филиал-товар: остаток ~U(0, 100) * U(1.2, 2.0)
+MEAN_PAIR_DEMAND = 80.0
+
+
+@dataclass(frozen=True, slots=True)
+class SynthSpec:
+	"""branches x products x days, у каждого филиала доля assortment товаров"""
+
+	branches: int
+	products: int
+	days: int
+	categories: int
+	assortment: float = 0.5
+	seed: int = 0
+
+	def __post_init__(self) -> None:
+		if min(self.branches, self.products, self.days, self.categories) < 1:
+			raise ValueError("branches, products, days and categories must be >= 1")
+		if not 0 < self.assortment <= 1:
+			raise ValueError(f"assortment must be in (0, 1], got {self.assortment}")
+
+	def rng(self, *parts: object) -> random.Random:
+		# отдельный поток на сущность: любую часть данных можно сгенерировать
+		# повторно, не проходя все предыдущие
+		return random.Random(":".join(map(str, (self.seed, *parts))))  # noqa: S311
+
+	@property
+	def dates(self) -> list[datetime.date]:
+		today = datetime.date.today()
+		return [today - datetime.timedelta(days=offset) for offset in range(self.days)]
+
+
+@dataclass(frozen=True, slots=True)
+class Catalog:
+	branch_ids: list[UUID]
+	product_ids: list[UUID]
+	category_ids: list[UUID]
+	# индекс категории и объем единицы по индексу товара
+	product_category: list[int]
+	volume_per_unit: list[Decimal]
+
+
+def _uuids(rng: random.Random, count: int) -> list[UUID]:
+	return [UUID(int=rng.getrandbits(128), version=4) for _ in range(count)]
+
+
+def build_catalog(spec: SynthSpec) -> Catalog:
+	rng = spec.rng("catalog")
+	return Catalog(
+		branch_ids=_uuids(rng, spec.branches),
+		product_ids=_uuids(rng, spec.products),
+		category_ids=_uuids(rng, spec.categories),
+		product_category=[rng.randrange(spec.categories) for _ in range(spec.products)],
+		volume_per_unit=[
+			to_numeric(rng.uniform(0.01, 3.0), 3) for _ in range(spec.products)
+		],
+	)
+
+
+def assortment(spec: SynthSpec, branch: int) -> Iterator[tuple[int, int, int, int]]:
+	"""(товар, остаток, резерв, транзит) базового дня филиала"""
+	rng = spec.rng("assortment", branch)
+	size = max(1, round(spec.products * spec.assortment))
+	for product in sorted(rng.sample(range(spec.products), size)):
+		stock = rng.randint(0, 100)
+		yield product, stock, rng.randint(0, stock // 10), rng.randint(0, stock // 10)
+
+
+def _perturb(value: float, rng: random.Random, delta: float = 0.1) -> Decimal:
+	return to_numeric(value * (1 + rng.uniform(-delta, delta)))
+
+
+def branch_history(spec: SynthSpec, catalog: Catalog) -> Iterator[tuple]:
+	for date in spec.dates:
+		for branch, branch_id in enumerate(catalog.branch_ids):
+			rng = spec.rng("branch_day", branch, date)
+			for product, *values in assortment(spec, branch):
+				yield (
+					date,
+					branch_id,
+					catalog.product_ids[product],
+					*(_perturb(value, rng) for value in values),
+				)
+
+
+def rc_history(spec: SynthSpec, catalog: Catalog) -> Iterator[tuple]:
+	"""Остаток РЦ вокруг суммарного спроса филиалов: часть товаров в дефиците,
+	часть в избытке — все режимы распределения работают на полную"""
+	rng = spec.rng("rc")
+	demand = spec.branches * spec.assortment * MEAN_PAIR_DEMAND
+	base = [
+		(stock := round(demand * rng.uniform(0.3, 1.5)), rng.randint(0, stock // 20))
+		for _ in range(spec.products)
+	]
+	for date in spec.dates:
+		day_rng = spec.rng("rc_day", date)
+		for product_id, (stock, reserved) in zip(
+			catalog.product_ids, base, strict=True
+		):
+			yield (
+				date,
+				product_id,
+				_perturb(stock, day_rng),
+				_perturb(reserved, day_rng),
+				0,
+			)
+
+
+def needs(spec: SynthSpec, catalog: Catalog) -> Iterator[tuple]:
+	for branch, branch_id in enumerate(catalog.branch_ids):
+		rng = spec.rng("needs", branch)
+		for product, stock, *_ in assortment(spec, branch):
+			yield (
+				branch_id,
+				catalog.product_ids[product],
+				to_numeric(max(stock, 1) * rng.uniform(1.2, 2.0)),
+			)
+
+
+def min_shipment(spec: SynthSpec, catalog: Catalog) -> Iterator[tuple]:
+	for branch, branch_id in enumerate(catalog.branch_ids):
+		rng = spec.rng("min_shipment", branch)
+		for product, *_ in assortment(spec, branch):
+			yield (
+				branch_id,
+				catalog.product_ids[product],
+				to_numeric(rng.uniform(0.01, 0.05)),
+			)
+
+
+def logdays(spec: SynthSpec, catalog: Catalog) -> Iterator[tuple]:
+	for branch, branch_id in enumerate(catalog.branch_ids):
+		rng = spec.rng("logdays", branch)
+		categories = sorted(
+			{
+				catalog.product_category[product]
+				for product, *_ in assortment(spec, branch)
+			}
+		)
+		for category in categories:
+			yield branch_id, catalog.category_ids[category], rng.choice([7, 14, 21])
+
+
+def storage_limits(spec: SynthSpec, catalog: Catalog) -> Iterator[tuple]:
+	"""Лимит чуть выше занятого объема, чтобы учет объема реально ограничивал"""
+	for branch, branch_id in enumerate(catalog.branch_ids):
+		rng = spec.rng("storage_limits", branch)
+		occupied = sum(
+			stock * float(catalog.volume_per_unit[product])
+			for product, stock, *_ in assortment(spec, branch)
+		)
+		yield branch_id, to_numeric(occupied * rng.uniform(1.05, 1.5))
+
+
+async def generate_synth(conn: asyncpg.Connection, spec: SynthSpec) -> int:
+	"""Заменяет все данные схемы синтетическими; при одном spec и дате запуска
+	результат одинаков бит в бит"""
+	started = time.perf_counter()
+	catalog = build_catalog(spec)
+	dates = spec.dates
+
+	tables = ", ".join(f"logistics.{table}" for table in SYNTH_TABLES)
+	await conn.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+	await ensure_partitions(conn, min(dates), max(dates))
+
+	loads = (
+		(
+			"products",
+			("product_id", "category_id"),
+			(
+				(product_id, catalog.category_ids[category])
+				for product_id, category in zip(
+					catalog.product_ids, catalog.product_category, strict=True
+				)
+			),
+		),
+		(
+			"products_vol",
+			("product_id", "volume_per_unit"),
+			zip(catalog.product_ids, catalog.volume_per_unit, strict=True),
+		),
+		("branch_product_history", BRANCH_COLUMNS, branch_history(spec, catalog)),
+		("rc_product_history", RC_COLUMNS, rc_history(spec, catalog)),
+		("needs", ("branch_id", "product_id", "needs"), needs(spec, catalog)),
+		(
+			"min_shipment",
+			("branch_id", "product_id", "min_qty"),
+			min_shipment(spec, catalog),
+		),
+		("logdays", ("branch_id", "category_id", "logdays"), logdays(spec, catalog)),
+		("storage_limits", ("branch_id", "max_volume"), storage_limits(spec, catalog)),
+	)
+	rows = 0
+	for table, columns, records in loads:
+		rows += await copy_records(conn, table, columns, stream_records(records))
+
+	# пересчет агрегатов заодно поднимает версию данных
+	await refresh_daily_aggregates(conn)
+	logger.info(
+		"Synthetic dataset generated",
+		branches=spec.branches,
+		products=spec.products,
+		days=spec.days,
+		categories=spec.categories,
+		seed=spec.seed,
+		rows=rows,
+		seconds=round(time.perf_counter() - started, 3),
+		stage="etl",
+	)
+	return rows
@@ -1,9 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
 from api.lifespan import lifespan
 from api.routers.distribution import router as distr_router
 from api.routers.manage import router as manage_router
+from api.routers.metrics import router as metrics_router
+from core.workflow.plan import QueryCostExceeded
 
 app = FastAPI(title="DNS-task", lifespan=lifespan)
+
+
+@app.exception_handler(QueryCostExceeded)
+async def query_cost_exceeded(request: Request, exc: QueryCostExceeded) -> JSONResponse:
+	return JSONResponse(
+		status_code=status.HTTP_400_BAD_REQUEST,
+		content={"detail": f"{exc}: narrow the filters or set limit"},
+	)
+
+
 app.include_router(manage_router)
 app.include_router(distr_router)
+app.include_router(metrics_router)
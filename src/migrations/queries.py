@@ -1,4 +1,13 @@
 from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class Migration:
+	sql: str
+	# CREATE INDEX CONCURRENTLY и подобное нельзя выполнять внутри транзакции
+	transactional: bool = True
+
 
 DEFAULT_SCHEMA = """
 				CREATE SCHEMA IF NOT EXISTS logistics;
@@ -79,16 +88,343 @@ DEFAULT_PRODUCTS_VOL = """
 					);
 					"""
 
+# Индексы под джойны calculate_distribution.
+# Один CREATE INDEX на миграцию: CONCURRENTLY не работает в multi-statement запросе.
+INDEX_BRANCH_HISTORY = """
+					CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_branch_history_date_branch_product
+					ON logistics.branch_product_history (date, branch_id, product_id);
+					"""
+
+INDEX_RC_HISTORY = """
+					CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_rc_history_date_product
+					ON logistics.rc_product_history (date, product_id);
+					"""
+
+INDEX_NEEDS = """
+				CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_needs_branch_product
+				ON logistics.needs (branch_id, product_id);
+				"""
+
+INDEX_MIN_SHIPMENT = """
+					CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_min_shipment_branch_product
+					ON logistics.min_shipment (branch_id, product_id);
+					"""
+
+INDEX_LOGDAYS = """
+				CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_logdays_branch_category
+				ON logistics.logdays (branch_id, category_id);
+				"""
+
+# Порядок выдачи /distribution: keyset-страница читается по индексу и
+# останавливается на LIMIT, не сортируя весь результат
+INDEX_NEEDS_ORDER = """
+					CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_needs_product_branch
+					ON logistics.needs (product_id, branch_id);
+					"""
+
+# Агрегаты по датам для calculate_distribution, обновляются ETL-шагом aggregates
+DEFAULT_DAILY_AGGREGATES = """
+					CREATE TABLE IF NOT EXISTS logistics.rc_available_daily (
+						date DATE NOT NULL,
+						product_id UUID NOT NULL,
+						available NUMERIC NOT NULL,
+						PRIMARY KEY (date, product_id)
+					);
+
+					CREATE TABLE IF NOT EXISTS logistics.branch_volume_daily (
+						date DATE NOT NULL,
+						branch_id UUID NOT NULL,
+						occupied_volume FLOAT8 NOT NULL,
+						PRIMARY KEY (date, branch_id)
+					);
+
+					INSERT INTO logistics.rc_available_daily (date, product_id, available)
+					SELECT date, product_id, SUM(stock - reserved - in_transit)
+					FROM logistics.rc_product_history
+					GROUP BY date, product_id
+					ON CONFLICT DO NOTHING;
+
+					INSERT INTO logistics.branch_volume_daily (date, branch_id, occupied_volume)
+					SELECT h.date, h.branch_id, COALESCE(SUM(h.stock * pv.volume_per_unit), 0)
+					FROM logistics.branch_product_history h
+					LEFT JOIN logistics.products_vol pv ON pv.product_id = h.product_id
+					GROUP BY h.date, h.branch_id
+					ON CONFLICT DO NOTHING;
+					"""
+
+# Монотонный счетчик версии данных: ETL и миграции инкрементят его и шлют NOTIFY
+DEFAULT_DATA_VERSION = """
+					CREATE TABLE IF NOT EXISTS logistics.data_version (
+						id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+						version BIGINT NOT NULL DEFAULT 0,
+						updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+					);
+
+					INSERT INTO logistics.data_version (id, version)
+					VALUES (TRUE, 0)
+					ON CONFLICT DO NOTHING;
+					"""
+
+# История — по партиции на день: запросы с date = $1 читают одну партицию,
+# перезагрузка дня — TRUNCATE одной партиции, retention — DETACH + DROP.
+# Партиции создает ensure_history_partitions (ETL и cli.py etl partitions);
+# DEFAULT-партиции нет, иначе DETACH CONCURRENTLY невозможен
+PARTITION_HISTORY = """
+					CREATE OR REPLACE FUNCTION logistics.ensure_history_partitions(
+						date_from DATE, date_to DATE
+					) RETURNS INT LANGUAGE plpgsql AS $$
+					DECLARE
+						partition_day DATE;
+						parent TEXT;
+						partition_name TEXT;
+						created INT := 0;
+					BEGIN
+						FOR partition_day IN
+							SELECT generate_series(date_from, date_to, INTERVAL '1 day')::date
+						LOOP
+							FOREACH parent IN ARRAY ARRAY['branch_product_history', 'rc_product_history']
+							LOOP
+								partition_name := parent || '_p' || to_char(partition_day, 'YYYYMMDD');
+								CONTINUE WHEN to_regclass('logistics.' || partition_name) IS NOT NULL;
+								EXECUTE format(
+									'CREATE TABLE IF NOT EXISTS logistics.%I PARTITION OF logistics.%I '
+									'FOR VALUES FROM (%L) TO (%L)',
+									partition_name, parent, partition_day, partition_day + 1
+								);
+								created := created + 1;
+							END LOOP;
+						END LOOP;
+						RETURN created;
+					END;
+					$$;
+
+					ALTER TABLE logistics.branch_product_history
+						RENAME TO branch_product_history_heap;
+					ALTER TABLE logistics.rc_product_history
+						RENAME TO rc_product_history_heap;
+
+					CREATE TABLE logistics.branch_product_history (
+						id BIGSERIAL,
+						date DATE NOT NULL,
+						branch_id UUID NOT NULL,
+						product_id UUID NOT NULL,
+						stock NUMERIC NOT NULL,
+						reserved NUMERIC NOT NULL,
+						in_transit NUMERIC NOT NULL,
+						PRIMARY KEY (date, id)
+					) PARTITION BY RANGE (date);
+
+					CREATE TABLE logistics.rc_product_history (
+						id BIGSERIAL,
+						date DATE NOT NULL,
+						product_id UUID NOT NULL,
+						stock NUMERIC NOT NULL,
+						reserved NUMERIC NOT NULL,
+						in_transit NUMERIC NOT NULL,
+						PRIMARY KEY (date, id)
+					) PARTITION BY RANGE (date);
+
+					-- внутри дневной партиции date в индексе лишний
+					CREATE INDEX ix_branch_history_branch_product
+					ON logistics.branch_product_history (branch_id, product_id);
+					CREATE INDEX ix_rc_history_product
+					ON logistics.rc_product_history (product_id);
+
+					SELECT logistics.ensure_history_partitions(
+						LEAST(MIN(date), CURRENT_DATE), GREATEST(MAX(date), CURRENT_DATE)
+					)
+					FROM (
+						SELECT date FROM logistics.branch_product_history_heap
+						UNION ALL
+						SELECT date FROM logistics.rc_product_history_heap
+					) AS heap;
+
+					INSERT INTO logistics.branch_product_history
+						(date, branch_id, product_id, stock, reserved, in_transit)
+					SELECT date, branch_id, product_id, stock, reserved, in_transit
+					FROM logistics.branch_product_history_heap;
+
+					INSERT INTO logistics.rc_product_history
+						(date, product_id, stock, reserved, in_transit)
+					SELECT date, product_id, stock, reserved, in_transit
+					FROM logistics.rc_product_history_heap;
+
+					DROP TABLE logistics.branch_product_history_heap;
+					DROP TABLE logistics.rc_product_history_heap;
+					"""
+
+# Естественные ключи вместо суррогатных id: по ним ETL делает upsert
+# (INSERT ... ON CONFLICT). Дубликаты ключей истории (повторы строк CSV)
+# схлопываются в одну строку с суммой остатков — расчет и раньше суммировал
+# их (остаток РЦ, занятый объем филиала). Дубликаты в needs, min_shipment,
+# logdays и storage_limits не угадываются: миграция падает со списком ключей.
+# DROP COLUMN id удаляет и старый первичный ключ; прежние индексы по тем же
+# колонкам становятся лишними
+UNIQUE_KEYS = """
+				WITH merged AS (
+					DELETE FROM logistics.branch_product_history h
+					USING (
+						SELECT date, branch_id, product_id
+						FROM logistics.branch_product_history
+						GROUP BY date, branch_id, product_id
+						HAVING count(*) > 1
+					) d
+					WHERE h.date = d.date AND h.branch_id = d.branch_id
+						AND h.product_id = d.product_id
+					RETURNING h.*
+				)
+				INSERT INTO logistics.branch_product_history
+					(date, branch_id, product_id, stock, reserved, in_transit)
+				SELECT date, branch_id, product_id, SUM(stock), SUM(reserved), SUM(in_transit)
+				FROM merged
+				GROUP BY date, branch_id, product_id;
+
+				WITH merged AS (
+					DELETE FROM logistics.rc_product_history h
+					USING (
+						SELECT date, product_id
+						FROM logistics.rc_product_history
+						GROUP BY date, product_id
+						HAVING count(*) > 1
+					) d
+					WHERE h.date = d.date AND h.product_id = d.product_id
+					RETURNING h.*
+				)
+				INSERT INTO logistics.rc_product_history
+					(date, product_id, stock, reserved, in_transit)
+				SELECT date, product_id, SUM(stock), SUM(reserved), SUM(in_transit)
+				FROM merged
+				GROUP BY date, product_id;
+
+				DO $$
+				DECLARE
+					total bigint;
+					sample text;
+				BEGIN
+					WITH duplicates AS (
+						SELECT 'needs' AS tbl, format('%s/%s', branch_id, product_id) AS key
+						FROM logistics.needs GROUP BY branch_id, product_id HAVING count(*) > 1
+						UNION ALL
+						SELECT 'min_shipment', format('%s/%s', branch_id, product_id)
+						FROM logistics.min_shipment GROUP BY branch_id, product_id HAVING count(*) > 1
+						UNION ALL
+						SELECT 'logdays', format('%s/%s', branch_id, category_id)
+						FROM logistics.logdays GROUP BY branch_id, category_id HAVING count(*) > 1
+						UNION ALL
+						SELECT 'storage_limits', branch_id::text
+						FROM logistics.storage_limits GROUP BY branch_id HAVING count(*) > 1
+					)
+					SELECT
+						count(*),
+						string_agg(tbl || ' ' || key, ', ' ORDER BY tbl, key)
+							FILTER (WHERE rn <= 20)
+					INTO total, sample
+					FROM (
+						SELECT *, row_number() OVER (ORDER BY tbl, key) AS rn
+						FROM duplicates
+					) numbered;
+					IF total > 0 THEN
+						RAISE EXCEPTION 'Duplicate keys in generated tables: % (first 20: %)',
+							total, sample
+							USING HINT = 'needs, min_shipment, logdays and storage_limits '
+								'are generated from history: truncate them, rerun migrate, '
+								'then etl run regenerates them';
+					END IF;
+				END
+				$$;
+
+				ALTER TABLE logistics.branch_product_history
+					DROP COLUMN id, ADD PRIMARY KEY (date, branch_id, product_id);
+				ALTER TABLE logistics.rc_product_history
+					DROP COLUMN id, ADD PRIMARY KEY (date, product_id);
+				ALTER TABLE logistics.needs
+					DROP COLUMN id, ADD PRIMARY KEY (branch_id, product_id);
+				ALTER TABLE logistics.min_shipment
+					DROP COLUMN id, ADD PRIMARY KEY (branch_id, product_id);
+				ALTER TABLE logistics.logdays
+					DROP COLUMN id, ADD PRIMARY KEY (branch_id, category_id);
+				ALTER TABLE logistics.storage_limits
+					DROP COLUMN id, ADD PRIMARY KEY (branch_id);
+
+				DROP INDEX IF EXISTS logistics.ix_branch_history_branch_product;
+				DROP INDEX IF EXISTS logistics.ix_rc_history_product;
+				DROP INDEX IF EXISTS logistics.ix_needs_branch_product;
+				DROP INDEX IF EXISTS logistics.ix_min_shipment_branch_product;
+				DROP INDEX IF EXISTS logistics.ix_logdays_branch_category;
+				"""
+
+# Водяные знаки инкрементального ETL: по строке на загружаемую таблицу.
+# loaded_through — последний загруженный день истории, checksum — отпечаток
+# источника (файл, лимиты, сид или состояние входных таблиц)
+DEFAULT_ETL_WATERMARK = """
+					CREATE TABLE IF NOT EXISTS logistics.etl_watermark (
+						table_name TEXT PRIMARY KEY,
+						loaded_through DATE,
+						checksum TEXT,
+						updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+					);
+					"""
+
+# CREATE TABLE IF NOT EXISTS не защищает от гонки: два параллельных вызова
+# оба не находят партицию и второй падает на DuplicateTable. Вызовы
+# сериализуются блокировкой до конца транзакции
+LOCK_HISTORY_PARTITIONS = """
+					CREATE OR REPLACE FUNCTION logistics.ensure_history_partitions(
+						date_from DATE, date_to DATE
+					) RETURNS INT LANGUAGE plpgsql AS $$
+					DECLARE
+						partition_day DATE;
+						parent TEXT;
+						partition_name TEXT;
+						created INT := 0;
+					BEGIN
+						PERFORM pg_advisory_xact_lock(
+							'logistics.ensure_history_partitions'::regproc::oid::bigint
+						);
+						FOR partition_day IN
+							SELECT generate_series(date_from, date_to, INTERVAL '1 day')::date
+						LOOP
+							FOREACH parent IN ARRAY ARRAY['branch_product_history', 'rc_product_history']
+							LOOP
+								partition_name := parent || '_p' || to_char(partition_day, 'YYYYMMDD');
+								CONTINUE WHEN to_regclass('logistics.' || partition_name) IS NOT NULL;
+								EXECUTE format(
+									'CREATE TABLE logistics.%I PARTITION OF logistics.%I '
+									'FOR VALUES FROM (%L) TO (%L)',
+									partition_name, parent, partition_day, partition_day + 1
+								);
+								created := created + 1;
+							END LOOP;
+						END LOOP;
+						RETURN created;
+					END;
+					$$;
+					"""
+
 MIGRATIONS = OrderedDict(
 	{
-		"001_create_schema": DEFAULT_SCHEMA,
-		"002_create_branch_history": DEFAULT_HISTORY,
-		"003_create_rc_history": DEFAULT_RC_HISTORY,
-		"004_create_needs": DEFAULT_NEEDS,
-		"005_create_logdays": DEFAULT_LOGDAYS,
-		"006_create_min_shipment": DEFAULT_SHIPMENT,
-		"007_create_storage_limits": DEFAULT_LIMITS,
-		"008_create_products": DEFAULT_PRODUCTS,
-		"009_create_products_vol": DEFAULT_PRODUCTS_VOL,
+		"001_create_schema": Migration(DEFAULT_SCHEMA),
+		"002_create_branch_history": Migration(DEFAULT_HISTORY),
+		"003_create_rc_history": Migration(DEFAULT_RC_HISTORY),
+		"004_create_needs": Migration(DEFAULT_NEEDS),
+		"005_create_logdays": Migration(DEFAULT_LOGDAYS),
+		"006_create_min_shipment": Migration(DEFAULT_SHIPMENT),
+		"007_create_storage_limits": Migration(DEFAULT_LIMITS),
+		"008_create_products": Migration(DEFAULT_PRODUCTS),
+		"009_create_products_vol": Migration(DEFAULT_PRODUCTS_VOL),
+		"010_index_branch_history": Migration(
+			INDEX_BRANCH_HISTORY, transactional=False
+		),
+		"011_index_rc_history": Migration(INDEX_RC_HISTORY, transactional=False),
+		"012_index_needs": Migration(INDEX_NEEDS, transactional=False),
+		"013_index_min_shipment": Migration(INDEX_MIN_SHIPMENT, transactional=False),
+		"014_index_logdays": Migration(INDEX_LOGDAYS, transactional=False),
+		"015_create_daily_aggregates": Migration(DEFAULT_DAILY_AGGREGATES),
+		"016_create_data_version": Migration(DEFAULT_DATA_VERSION),
+		"017_index_needs_order": Migration(INDEX_NEEDS_ORDER, transactional=False),
+		"018_partition_history": Migration(PARTITION_HISTORY),
+		"019_unique_keys": Migration(UNIQUE_KEYS),
+		"020_create_etl_watermark": Migration(DEFAULT_ETL_WATERMARK),
+		"021_lock_history_partitions": Migration(LOCK_HISTORY_PARTITIONS),
 	}
 )